@@ -0,0 +1,122 @@
+import numpy as np
+
+from agent import Agent
+
+
+class ArrayQLearningAgent(Agent):
+
+    def __init__(self, compiled, discount=0.9, learningRate=0.1, epsilon=0.3, dtype=np.float64):
+        """
+        Q-learning on a dense Q-table Q[s, a] indexed by the state
+        and action ids of a CompiledGridworld. Illegal actions hold
+        -inf, so the greedy action of a state is a plain argmax.
+
+        The tuple based methods of Agent work as in QLearningAgent.
+        The ...Ids methods take arrays of state ids and answer for
+        all of them at once, and updateBatch applies the updates of
+        many transitions in one step. dtype=np.float32 halves the
+        memory of the table, e.g. 20 MB for a million states.
+        """
+        self.setLearningRate(learningRate)
+        self.setEpsilon(epsilon)
+        self.setDiscount(discount)
+        self.compiled = compiled
+
+        self.qInitValue = 0  # initial value for legal state action pairs
+        self.Q = np.where(compiled.legal, self.qInitValue, -np.inf).astype(dtype)
+        self.hasActions = compiled.legal.any(axis=1)
+
+    def setLearningRate(self, learningRate):
+        self.learningRate = learningRate
+
+    def setEpsilon(self, epsilon):
+        self.epsilon = epsilon
+
+    def setDiscount(self, discount):
+        self.discount = discount
+
+    def getValueIds(self, stateIds):
+        """
+        Max q-value of each state id, 0 for states without actions.
+        """
+        return np.where(self.hasActions[stateIds], self.Q[stateIds].max(axis=1), 0.0)
+
+    def getPolicyIds(self, stateIds):
+        """
+        Greedy action id of each state id, with ties broken
+        uniformly at random, or -1 for states without actions.
+        """
+        Q = self.Q[stateIds]
+        best = Q == Q.max(axis=1, keepdims=True)
+        return self.pickAction(best, stateIds)
+
+    def getRandomActionIds(self, stateIds):
+        """
+        A uniformly random legal action id per state id, or -1.
+        """
+        return self.pickAction(self.compiled.legal[stateIds], stateIds)
+
+    def getActionIds(self, stateIds):
+        """
+        Epsilon-greedy action ids of all the state ids at once.
+        """
+        explore = np.random.random(len(stateIds)) < self.epsilon
+        return np.where(explore, self.getRandomActionIds(stateIds), self.getPolicyIds(stateIds))
+
+    def pickAction(self, candidates, stateIds):
+        """
+        Picks one True column per row of 'candidates' uniformly at
+        random, -1 for rows of states without actions.
+        """
+        draws = np.random.random(candidates.shape)
+        draws[~candidates] = -1.0
+        actions = np.argmax(draws, axis=1)
+        actions[~self.hasActions[stateIds]] = -1
+        return actions
+
+    def updateIds(self, stateId, actionId, nextStateId, reward):
+        """
+        TD update of one transition given as ids.
+        """
+        sample = reward + self.discount * self.getValueIds(np.array([nextStateId]))[0]
+        q_value = self.Q[stateId, actionId]
+        self.Q[stateId, actionId] = q_value + self.learningRate * (sample - q_value)
+
+    def updateBatch(self, stateIds, actionIds, nextStateIds, rewards):
+        """
+        TD updates of a batch of transitions given as id arrays, e.g.
+        one step of a VectorizedGridworldEnvironment. All targets use
+        the table from before the batch. A pair that occurs several
+        times moves by the mean of its TD errors, as one update towards
+        the mean target, instead of once per occurrence.
+        """
+        targets = rewards + self.discount * self.getValueIds(nextStateIds)
+        errors = targets - self.Q[stateIds, actionIds]
+
+        pairs = stateIds.astype(np.int64) * self.Q.shape[1] + actionIds
+        unique, inverse = np.unique(pairs, return_inverse=True)
+        means = np.bincount(inverse, weights=errors) / np.bincount(inverse)
+        self.Q.reshape(-1)[unique] += (self.learningRate * means).astype(self.Q.dtype)
+
+    def getValue(self, state):
+        """ Look up the current value of the state. """
+        return float(self.getValueIds(np.array([self.compiled.stateId(state)]))[0])
+
+    def getQValue(self, state, action):
+        """ Look up the current q-value of the state action pair. """
+        return float(self.Q[self.compiled.stateId(state), self.compiled.actionIndex[action]])
+
+    def getPolicy(self, state):
+        """ Look up the current recommendation for the state. """
+        action = self.getPolicyIds(np.array([self.compiled.stateId(state)]))[0]
+        return None if action < 0 else self.compiled.actions[action]
+
+    def getAction(self, state):
+        """ Choose an epsilon-greedy action. """
+        action = self.getActionIds(np.array([self.compiled.stateId(state)]))[0]
+        return None if action < 0 else self.compiled.actions[action]
+
+    def update(self, state, action, nextState, reward):
+        """ Update parameters in response to the observed transition. """
+        c = self.compiled
+        self.updateIds(c.stateId(state), c.actionIndex[action], c.stateId(nextState), reward)
@@ -6,47 +6,165 @@ from agent import Agent
 
 class PolicyIterationAgent(Agent):
 
-    def __init__(self, mdp, discount=0.9, iterations=100):
+    # evaluation='modified' stops evaluating once a sweep changes V by less
+    # than this fraction of the Bellman residual of the last improvement step
+    CUTOFF = 0.5
+
+    def __init__(self, mdp, discount=0.9, iterations=100, evaluation='sweeps', tolerance=1e-6,
+                 transitions='padded', workers=1, stats=None):
         """
         Your policy iteration agent take an mdp on
         construction, run the indicated number of iterations
         and then act according to the resulting policy.
+
+        With evaluation='sweeps' each policy is evaluated by at
+        most 'iterations' rounds of sweeps, stopping once a sweep
+        changes no value by more than 'tolerance'. With evaluation='exact'
+        the agent works on the compiled Gridworld arrays and
+        solves (I - discount * P_pi) V = R_pi with a sparse
+        direct solver instead. With evaluation='modified' the
+        evaluation updates V in place (Gauss-Seidel order) and
+        stops early once the largest change of a sweep drops below
+        a fraction of the current Bellman residual, using at most
+        'iterations' sweeps; planning ends once the Bellman
+        residual is at most 'tolerance'.
+        'transitions' picks the transition store used for the
+        improvement steps of the compiled modes: 'padded', 'csr'
+        or 'dense'. With workers > 1 the 'sweeps' evaluation and the
+        improvement steps run on the compiled arrays on a process
+        pool over bands of grid rows.
+
+        'stats' is an optional PlanningStats collector that gets one
+        record per evaluation sweep and per improvement step (see
+        planningStats). With a collector the agent does not print.
+
+        Once planning has finished the q-values and the policy are
+        materialized (see snapshot), so the getters are lookups.
+        After the mdp changed, replan continues from this policy.
         """
         self.mdp = mdp
         self.discount = discount
         self.iterations = iterations
+        self.evaluation = evaluation
+        self.tolerance = tolerance
+        self.transitions = transitions
+        self.workers = workers
+        self.stats = stats
+
+        # whether the run works on the compiled arrays or on dicts
+        self.vectorized = evaluation in ('exact', 'modified') or workers > 1
+        if evaluation == 'exact':
+            self.runExact()
+        elif evaluation == 'modified':
+            self.runModified()
+        elif workers > 1:
+            self.runParallel()
+        else:
+            self.runSweeps()
+        self.snapshot()
+
+    def snapshot(self):
+        """
+        Materializes the q-values under the evaluated values and the
+        policy, one entry per (state, action) and per state.
+        """
+        if self.vectorized:
+            c = self.compiled
+            self.qTable = c.qValues(self.values, self.discount, transitions=self.transitions)
+            self.policy = [None if a < 0 else c.actions[a] for a in self.policyIds.tolist()]
+        else:
+            self.qTable = {(s, a): self.computeQValue(s, a)
+                           for s in self.mdp.getStates() for a in self.mdp.getPossibleActions(s)}
+            self.policy = self.pi
+
+    def replan(self):
+        """
+        Plans again after the noise, the living reward or cells of
+        the mdp changed, starting from the current policy and values
+        instead of the initial ones. States keep their action where it
+        is still legal; states that are new or lost their action start
+        greedy w.r.t. the current values. Only a few improvement steps
+        are needed when the change is local.
+        """
+        if not self.vectorized:
+            states = set(self.mdp.getStates())
+            pi = {s: a for s, a in self.pi.items() if s in states and a in self.mdp.getPossibleActions(s)}
+            self.runSweeps(self.V, pi)
+            self.snapshot()
+            return
+
+        old = self.compiled
+        c = self.mdp.compile()
+        if c is old:
+            return
+        oldIds, changed = c.diff(old)
+        values = np.where(oldIds >= 0, self.values[oldIds], 0.0)
+        policyIds = np.where(oldIds >= 0, self.policyIds[oldIds], -1)
+        states = np.arange(c.numStates)
+        lost = c.legal.any(axis=1) & ((policyIds < 0) | ~c.legal[states, np.maximum(policyIds, 0)])
+        greedy = c.greedyPolicy(c.qValues(values, self.discount, transitions=self.transitions))
+        policyIds[lost] = greedy[lost]
+        policyIds[~c.legal.any(axis=1)] = -1
 
+        if self.evaluation == 'exact':
+            self.runExact(policyIds)
+        elif self.evaluation == 'modified':
+            self.runModified(policyIds, values)
+        else:
+            self.runParallel(policyIds, values)
+        self.snapshot()
+
+    def runSweeps(self, initialValues=None, initialPolicy=None):
+        """
+        Policy iteration with at most 'iterations' sweeps of policy
+        evaluation per improvement step (fewer once a sweep changes
+        V by at most 'tolerance'), starting from the given value and
+        policy dicts (missing states start at 0 and at
+        their last action) or from scratch.
+        """
         states = self.mdp.getStates()
         number_states = len(states)
+        initialValues = initialValues or {}
+        initialPolicy = initialPolicy or {}
         # Policy initialization
         # ******************
         # TODO 1.1.a)
-        # self.V = ...
-
+        self.V = {key: initialValues.get(key, 0) for key in states}
         # *******************
 
         self.pi = {s: self.mdp.getPossibleActions(s)[-1] if self.mdp.getPossibleActions(s) else None for s in states}
+        self.pi.update(initialPolicy)
 
         counter = 0
+        self.sweeps = 0
+        if self.stats is not None:
+            self.stats.begin('runSweeps')
 
         while True:
             # Policy evaluation
-            for i in range(iterations):
+            for i in range(self.iterations):
                 newV = {}
                 for s in states:
                     a = self.pi[s]
                     # *****************
                     # TODO 1.1.b)
-                    # if...
-                    #
-                    # else:...
+                    if self.mdp.isTerminal(s):
+                        newV[s] = 0.0
+                    else:
+                        newV[s] = self.computeQValue(s, a)
 
-                # update value estimate
-                # self.V=...
+                residual = max(abs(newV[s] - self.V[s]) for s in states)
+                if self.stats is not None:
+                    self.stats.record('evaluation', residual, statesTouched=number_states)
 
+                # update value estimate
+                self.V = newV
+                self.sweeps += 1
+                if residual <= self.tolerance: break
                 # ******************
 
             policy_stable = True
+            changes = 0
             for s in states:
                 actions = self.mdp.getPossibleActions(s)
                 if len(actions) < 1:
@@ -55,16 +173,242 @@ class PolicyIterationAgent(Agent):
                     old_action = self.pi[s]
                     # ************
                     # TODO 1.1.c)
-                    # self.pi[s] = ...
-
-                    # policy_stable =
+                    q_values = [self.computeQValue(s, action) for action in actions]
+                    # ties go to the last action, and the action only changes
+                    # on a strict improvement, as in runExact
+                    best = len(actions) - 1 - int(np.argmax(q_values[::-1]))
+                    if old_action not in actions:
+                        self.pi[s] = actions[best]
+                    else:
+                        current = q_values[actions.index(old_action)]
+                        if q_values[best] > current + 1e-12 * (1.0 + abs(current)):
+                            self.pi[s] = actions[best]
 
+                    if old_action != self.pi[s]:
+                        policy_stable = False
+                        changes += 1
                     # ****************
             counter += 1
+            if self.stats is not None:
+                self.stats.record('improvement', policyChanges=changes, statesTouched=number_states)
 
             if policy_stable: break
 
-        print("Policy converged after %i iterations of policy iteration" % counter)
+        self.improvementSteps = counter
+        if self.stats is None:
+            print("Policy converged after %i iterations of policy iteration" % counter)
+
+    def runParallel(self, policyIds=None, values=None):
+        """
+        Policy iteration as in runSweeps, where every evaluation
+        sweep and every improvement step is split into bands of grid
+        rows that 'workers' processes handle concurrently. Starts from the
+        given policy ids and values if any.
+        """
+        from parallelPlanning import ParallelSweeper
+
+        self.compiled = self.mdp.compile()
+        c = self.compiled
+        sweeper = ParallelSweeper(c, self.workers)
+        try:
+            if policyIds is None:
+                policyIds = c.greedyPolicy(np.where(c.legal, 0.0, -np.inf))
+            sweeper.setPolicy(policyIds)
+            if values is not None:
+                sweeper.setValues(values)
+            counter = 0
+            self.sweeps = 0
+            if self.stats is not None:
+                self.stats.begin('runParallel')
+            while True:
+                for i in range(self.iterations):
+                    residual = sweeper.policySweep(self.discount)
+                    self.sweeps += 1
+                    if self.stats is not None:
+                        self.stats.record('evaluation', residual, statesTouched=c.numStates)
+                    if residual <= self.tolerance: break
+                changes = sweeper.improve(self.discount)
+                counter += 1
+                if self.stats is not None:
+                    self.stats.record('improvement', policyChanges=changes, statesTouched=c.numStates)
+
+                if changes == 0: break
+            self.values = sweeper.getValues()
+            self.policyIds = sweeper.getPolicy()
+        finally:
+            sweeper.close()
+
+        self.improvementSteps = counter
+        if self.stats is None:
+            print("Policy converged after %i iterations of policy iteration" % counter)
+
+    def runExact(self, policyIds=None):
+        """
+        Policy iteration on the compiled arrays of the mdp. Every
+        policy is evaluated exactly by one sparse linear solve and
+        improved greedily in one batched step. Starts from the given
+        policy ids if any.
+        """
+        self.compiled = self.mdp.compile()
+        c = self.compiled
+        states = np.nonzero(c.legal.any(axis=1))[0]
+
+        # start from the last possible action in every state
+        if policyIds is None:
+            policyIds = c.greedyPolicy(np.where(c.legal, 0.0, -np.inf))
+        self.policyIds = policyIds
+
+        counter = 0
+        if self.stats is not None:
+            self.stats.begin('runExact')
+        while True:
+            self.values = self.evaluatePolicy(self.policyIds)
+            Q = c.qValues(self.values, self.discount, transitions=self.transitions)
+            greedy = c.greedyPolicy(Q)
+
+            # only switch actions on a strict improvement, so ties cannot cycle
+            current = Q[states, self.policyIds[states]]
+            best = Q[states, greedy[states]]
+            improved = states[best > current + 1e-12 * (1.0 + np.abs(current))]
+            self.policyIds[improved] = greedy[improved]
+            counter += 1
+            if self.stats is not None:
+                # Bellman residual of the exact values of the evaluated policy
+                self.stats.record('improvement', np.abs(best - self.values[states]).max(initial=0.0),
+                                  len(improved), c.numStates)
+
+            if len(improved) == 0: break
+
+        self.improvementSteps = counter
+        if self.stats is None:
+            print("Policy converged after %i iterations of policy iteration" % counter)
+
+    def runModified(self, policyIds=None, values=None):
+        """
+        Modified policy iteration on the compiled arrays of the mdp.
+        Every improvement step is preceded by in-place Gauss-Seidel
+        sweeps that stop once a sweep changes V by less than a
+        fraction of the current Bellman residual max|TV - V|. Ends
+        once the Bellman residual is at most 'tolerance'. Starts from
+        the given policy ids and values if any.
+        """
+        self.compiled = self.mdp.compile()
+        c = self.compiled
+        states = np.nonzero(c.legal.any(axis=1))[0]
+
+        if policyIds is None:
+            policyIds = c.greedyPolicy(np.where(c.legal, 0.0, -np.inf))
+        self.policyIds = policyIds
+        self.values = np.zeros(c.numStates) if values is None else values
+        self.sweeps = 0
+
+        Q = c.qValues(self.values, self.discount, transitions=self.transitions)
+        bellman = np.abs(Q[states].max(axis=1) - self.values[states]).max(initial=0.0)
+
+        counter = 0
+        if self.stats is not None:
+            self.stats.begin('runModified')
+        while True:
+            self.evaluatePolicyInPlace(self.policyIds, self.CUTOFF * bellman)
+            Q = c.qValues(self.values, self.discount, transitions=self.transitions)
+            greedy = c.greedyPolicy(Q)
+
+            current = Q[states, self.policyIds[states]]
+            best = Q[states, greedy[states]]
+            improved = states[best > current + 1e-12 * (1.0 + np.abs(current))]
+            self.policyIds[improved] = greedy[improved]
+            bellman = np.abs(best - self.values[states]).max(initial=0.0)
+            counter += 1
+            if self.stats is not None:
+                self.stats.record('improvement', bellman, len(improved), c.numStates)
+
+            if bellman <= self.tolerance: break
+
+        self.improvementSteps = counter
+        if self.stats is None:
+            print("Policy converged after %i iterations of policy iteration" % counter)
+
+    def evaluatePolicyInPlace(self, policyIds, threshold):
+        """
+        Runs Gauss-Seidel sweeps of the policy given by 'policyIds'
+        on self.values until a sweep changes no value by more than
+        'threshold' or 'iterations' sweeps were done. Returns the
+        residual of the last sweep.
+
+        A sweep in state-id order that always reads the newest values
+        is the triangular solve (I - discount * L) V' = R + discount * U V,
+        with L the part of P_pi below the diagonal and U the rest.
+        Sweeps alternate between increasing and decreasing state ids
+        so that values travel quickly in both directions.
+        """
+        from scipy.sparse import identity, tril, triu
+        from scipy.sparse.linalg import spsolve_triangular
+
+        P, R = self.policyMatrix(policyIds)
+        I = identity(P.shape[0], format='csr')
+        lower = tril(P, k=-1, format='csr')
+        upper = triu(P, k=1, format='csr')
+        diagonal = P - lower - upper
+        forward = ((I - self.discount * lower).tocsr(), (upper + diagonal).tocsr(), True)
+        backward = ((I - self.discount * upper).tocsr(), (lower + diagonal).tocsr(), False)
+
+        V = self.values
+        residual = np.inf
+        for i in range(self.iterations):
+            A, B, isLower = forward if self.sweeps % 2 == 0 else backward
+            newV = spsolve_triangular(A, R + self.discount * (B @ V), lower=isLower)
+            residual = np.abs(newV - V).max()
+            V = newV
+            self.sweeps += 1
+            if self.stats is not None:
+                self.stats.record('evaluation', residual, statesTouched=len(V))
+            if residual <= threshold: break
+        self.values = V
+        return residual
+
+    def policyMatrix(self, policyIds):
+        """
+        Returns the sparse transition matrix P_pi and the reward
+        vector R_pi of the policy given by 'policyIds'.
+        """
+        from scipy.sparse import csr_matrix
+
+        c = self.compiled
+        states = np.nonzero(policyIds >= 0)[0]
+        actions = policyIds[states]
+        rows = np.repeat(states, c.SLOTS)
+        cols = c.nextStates[states, actions].ravel()
+        probs = c.probs[states, actions].ravel()
+        P = csr_matrix((probs, (rows, cols)), shape=(c.numStates, c.numStates))
+
+        R = np.zeros(c.numStates)
+        R[states] = c.rewards[states, actions]
+        return P, R
+
+    def evaluatePolicy(self, policyIds):
+        """
+        Returns the exact values of the policy given by 'policyIds'
+        by solving (I - discount * P_pi) V = R_pi.
+        """
+        from scipy.sparse import identity
+        from scipy.sparse.linalg import spsolve
+
+        P, R = self.policyMatrix(policyIds)
+        A = identity(P.shape[0], format='csr') - self.discount * P
+        return spsolve(A.tocsc(), R)
+
+    def computeQValue(self, state, action):
+        """
+        One-step lookahead of 'action' in 'state' under the
+        current value estimate.
+        """
+        transition_states_and_probs = self.mdp.getTransitionStatesAndProbs(state, action)
+        reward = self.mdp.getReward(state, action, None)
+
+        q_value = 0
+        for nextState, prob in transition_states_and_probs:
+            q_value += prob * (reward + self.discount * self.V[nextState])
+        return q_value
 
     def getValue(self, state):
         """
@@ -72,7 +416,9 @@ class PolicyIterationAgent(Agent):
         """
         # *******
         # TODO 1.2.
-
+        if self.vectorized:
+            return self.values[self.compiled.stateId(state)]
+        return self.V[state]
         # ********
 
     def getQValue(self, state, action):
@@ -85,7 +431,9 @@ class PolicyIterationAgent(Agent):
         """
         # *********
         # TODO 1.3.
-
+        if self.vectorized:
+            return self.qTable[self.compiled.stateId(state), self.compiled.actionIndex[action]]
+        return self.qTable[(state, action)]
         # **********
 
     def getPolicy(self, state):
@@ -95,7 +443,9 @@ class PolicyIterationAgent(Agent):
         """
         # **********
         # TODO 1.4.
-
+        if self.vectorized:
+            return self.policy[self.compiled.stateId(state)]
+        return self.policy[state]
         # **********
 
     def getAction(self, state):
@@ -0,0 +1,110 @@
+import util
+from agent import Agent
+
+
+class PrioritizedSweepingAgent(Agent):
+
+    def __init__(self, mdp, discount=0.9, iterations=100, theta=1e-5):
+        """
+        A prioritized sweeping agent takes an mdp on construction
+        and backs up one state at a time, always the state with the
+        largest Bellman error. After a backup only the predecessors
+        of that state are re-prioritized, so states far from any
+        change are never touched.
+
+        Planning stops when no state has a Bellman error above
+        'theta' or after the work of 'iterations' full sweeps,
+        i.e. iterations * len(states) backups.
+        """
+        self.mdp = mdp
+        self.discount = discount
+        self.iterations = iterations
+        self.theta = theta
+
+        states = self.mdp.getStates()
+        self.V = {s: 0 for s in states}
+
+        # predecessor index: states that can reach s with non-zero probability
+        self.predecessors = {s: set() for s in states}
+        for s in states:
+            for a in self.mdp.getPossibleActions(s):
+                for nextState, prob in self.mdp.getTransitionStatesAndProbs(s, a):
+                    if prob > 0:
+                        self.predecessors[nextState].add(s)
+
+        # the queue pops the lowest priority, so use the negative error
+        queue = util.PriorityQueue()
+        for s in states:
+            if self.mdp.isTerminal(s):
+                continue
+            diff = abs(self.V[s] - self.computeBestValue(s))
+            if diff > self.theta:
+                queue.update(s, -diff)
+
+        self.backups = 0
+        maxBackups = self.iterations * len(states)
+        while not queue.isEmpty() and self.backups < maxBackups:
+            s = queue.pop()
+            if not self.mdp.isTerminal(s):
+                self.V[s] = self.computeBestValue(s)
+            self.backups += 1
+
+            for p in self.predecessors[s]:
+                diff = abs(self.V[p] - self.computeBestValue(p))
+                if diff > self.theta:
+                    queue.update(p, -diff)
+
+    def computeBestValue(self, state):
+        """
+        Max over the q-values of 'state', or 0 without actions.
+        """
+        actions = self.mdp.getPossibleActions(state)
+        if len(actions) < 1:
+            return 0.0
+        return max(self.getQValue(state, a) for a in actions)
+
+    def getValue(self, state):
+        """
+        Look up the value of the state after planning.
+        """
+        return self.V[state]
+
+    def getQValue(self, state, action):
+        """
+        One-step lookahead of 'action' in 'state' under the
+        planned values.
+        """
+        reward = self.mdp.getReward(state, action, None)
+        q_value = 0
+        for nextState, prob in self.mdp.getTransitionStatesAndProbs(state, action):
+            q_value += prob * (reward + self.discount * self.V[nextState])
+        return q_value
+
+    def getPolicy(self, state):
+        """
+        Greedy action w.r.t. the planned values. Ties go to the
+        last action, as in ValueIterationAgent.
+        """
+        actions = self.mdp.getPossibleActions(state)
+        if len(actions) < 1:
+            return None
+
+        best_value, best_a = float('-inf'), None
+        for a in actions:
+            q_value = self.getQValue(state, a)
+            if q_value >= best_value:
+                best_value, best_a = q_value, a
+        return best_a
+
+    def getAction(self, state):
+        """
+        Return the action recommended by the policy.
+        """
+        return self.getPolicy(state)
+
+    def update(self, state, action, nextState, reward):
+        """
+        Not used for planning agents!
+        """
+
+        pass
@@ -8,17 +8,27 @@ from agent import Agent
 
 class QLearningAgent(Agent):
 
-    def __init__(self, actionFunction, discount=0.9, learningRate=0.1, epsilon=0.3):
+    def __init__(self, actionFunction, discount=0.9, learningRate=0.1, epsilon=0.3, planningSteps=0):
         """ A Q-Learning agent gets nothing about the mdp on construction other than a function mapping states to
-        actions. The other parameters govern its exploration strategy and learning rate. """
+        actions. The other parameters govern its exploration strategy and learning rate.
+
+        With planningSteps > 0 the agent learns a model of the observed transitions (Dyna-Q) and follows every real
+        update by that many simulated updates drawn from the model. """
         self.setLearningRate(learningRate)
         self.setEpsilon(epsilon)
         self.setDiscount(discount)
         self.actionFunction = actionFunction
+        self.planningSteps = planningSteps
 
         self.qInitValue = 0  # initial value for states
         self.Q = {}
 
+        # model: row p counts the outcomes (nextState, reward) seen after the p-th observed (state, action) pair
+        self.modelPairs = []
+        self.modelIndex = {}
+        self.modelOutcomes = []
+        self.modelCounts = np.zeros((16, 3), dtype=np.int64)
+
     def setLearningRate(self, learningRate):
         self.learningRate = learningRate
 
@@ -32,28 +42,37 @@ class QLearningAgent(Agent):
         """ Look up the current value of the state. """
         # *********
         # TODO 3.1.
-
+        actions = self.actionFunction(state)
+        if len(actions) < 1:
+            return 0.0
+        return max(self.getQValue(state, a) for a in actions)
         # *********
 
     def getQValue(self, state, action):
         """ Look up the current q-value of the state action pair. """
         # *********
         # TODO 3.2.
-
+        return self.Q.get((state, action), self.qInitValue)
         # *********
 
     def getPolicy(self, state):
         """ Look up the current recommendation for the state. """
         # *********
         # TODO 3.3.
-
+        actions = self.actionFunction(state)
+        if len(actions) < 1:
+            return None
+        q_values = [self.getQValue(state, a) for a in actions]
+        best_value = max(q_values)
+        best_actions = [a for a, q in zip(actions, q_values) if q == best_value]
+        return best_actions[np.random.randint(len(best_actions))]
         # *********
 
     def getRandomAction(self, state):
         all_actions = self.actionFunction(state)
         if len(all_actions) > 0:
             # *********
-
+            return all_actions[np.random.randint(len(all_actions))]
             # *********
         else:
             return "exit"
@@ -62,12 +81,49 @@ class QLearningAgent(Agent):
         """ Choose an action: this will require that your agent balance exploration and exploitation as appropriate. """
         # *********
         # TODO 3.4.
-
+        if np.random.random() < self.epsilon:
+            return self.getRandomAction(state)
+        return self.getPolicy(state)
         # *********
 
     def update(self, state, action, nextState, reward):
         """ Update parameters in response to the observed transition. """
         # *********
         # TODO 3.5.
-
+        sample = reward + self.discount * self.getValue(nextState)
+        q_value = self.getQValue(state, action)
+        self.Q[(state, action)] = q_value + self.learningRate * (sample - q_value)
         # *********
+
+        if self.planningSteps > 0:
+            self.observe(state, action, nextState, reward)
+            for state, action, nextState, reward in self.sampleModel(self.planningSteps):
+                sample = reward + self.discount * self.getValue(nextState)
+                q_value = self.getQValue(state, action)
+                self.Q[(state, action)] = q_value + self.learningRate * (sample - q_value)
+
+    def observe(self, state, action, nextState, reward):
+        """ Count the transition in the model. """
+        pair = self.modelIndex.get((state, action))
+        if pair is None:
+            pair = self.modelIndex[(state, action)] = len(self.modelPairs)
+            self.modelPairs.append((state, action))
+            self.modelOutcomes.append([])
+            if pair == len(self.modelCounts):
+                self.modelCounts = np.concatenate((self.modelCounts, np.zeros_like(self.modelCounts)))
+
+        outcomes = self.modelOutcomes[pair]
+        if (nextState, reward) not in outcomes:
+            if len(outcomes) == self.modelCounts.shape[1]:
+                self.modelCounts = np.concatenate((self.modelCounts, np.zeros_like(self.modelCounts)), axis=1)
+            outcomes.append((nextState, reward))
+        self.modelCounts[pair, outcomes.index((nextState, reward))] += 1
+
+    def sampleModel(self, n):
+        """ Draw n simulated transitions: uniformly random observed (state, action) pairs, each with an outcome drawn
+        in proportion to how often it was observed. """
+        pairs = np.random.randint(len(self.modelPairs), size=n)
+        cumulative = np.cumsum(self.modelCounts[pairs], axis=1)
+        draws = np.random.random(n) * cumulative[:, -1]
+        outcomes = (draws[:, None] >= cumulative).sum(axis=1)
+        return [self.modelPairs[p] + self.modelOutcomes[p][o] for p, o in zip(pairs.tolist(), outcomes.tolist())]
@@ -4,27 +4,150 @@ import numpy as np
 # TASK 2
 class ValueIterationAgent(Agent):
 
-    def __init__(self, mdp, discount=0.9, iterations=100):
+    def __init__(self, mdp, discount=0.9, iterations=100, tolerance=0.0, backend='numpy', transitions='padded',
+                 workers=1, stats=None):
         """
         Your value iteration agent take an mdp on
         construction, run the indicated number of iterations
         and then act according to the resulting policy.
+
+        With backend='numpy' the sweeps run vectorized on the
+        compiled Gridworld arrays. backend='python' runs the
+        original per-state loop. Both stop early once the largest
+        value change of a sweep is at most 'tolerance'. 'transitions' picks the
+        transition store of the numpy backend: 'padded', 'csr'
+        or 'dense' (see CompiledGridworld.memoryReport). With
+        workers > 1 the numpy sweeps run on a process pool over
+        bands of grid rows with the values in shared memory.
+
+        'stats' is an optional PlanningStats collector that gets one
+        record per sweep (see planningStats). With a collector the
+        python backend does not print its sweep numbers.
+
+        Once planning has finished the q-values and the policy are
+        materialized (see snapshot), so the getters are lookups.
+        After the mdp changed, replan continues from these values.
         """
         self.mdp = mdp
         self.discount = discount
         self.iterations = iterations
+        self.tolerance = tolerance
+        self.transitions = transitions
+        self.workers = workers
+        self.stats = stats
+        self.sweeps = 0
+
+        # the vectorized backend needs the compiled array view of a Gridworld
+        if backend == 'numpy' and not hasattr(self.mdp, 'compile'):
+            backend = 'python'
+        self.backend = backend
+
+        if backend == 'numpy' and workers > 1:
+            self.runParallel()
+        elif backend == 'numpy':
+            self.runVectorized()
+        else:
+            self.runSweeps()
+        self.snapshot()
+
+    def snapshot(self):
+        """
+        Materializes the q-values under the planned values and the
+        policy, one entry per (state, action) and per state.
+        """
+        if self.backend == 'numpy':
+            c = self.compiled
+            self.qTable = c.qValues(self.values, self.discount, transitions=self.transitions)
+            self.policy = [None if a < 0 else c.actions[a] for a in self.policyIds.tolist()]
+        else:
+            self.qTable = {(s, a): self.computeQValue(s, a)
+                           for s in self.mdp.getStates() for a in self.mdp.getPossibleActions(s)}
+            self.policy = self.best_a
 
+    def replan(self):
+        """
+        Plans again after the noise, the living reward or cells of
+        the mdp changed, starting from the current values instead of
+        V = 0. Returns the number of state backups spent.
+
+        On the numpy backend only the states whose actions,
+        transitions or rewards changed are backed up first. After
+        that, each round backs up the predecessors of the states
+        whose value moved by more than 'tolerance', for at most
+        'iterations' rounds. The python backend runs its full sweeps
+        from the current values.
+        """
+        if self.backend != 'numpy':
+            self.sweeps = 0
+            self.runSweeps(self.V)
+            self.snapshot()
+            return self.sweeps * len(self.V)
+
+        old = self.compiled
+        c = self.mdp.compile()
+        if c is old:
+            return 0
+        oldIds, changed = c.diff(old)
+        V = np.where(oldIds >= 0, self.values[oldIds], 0.0)
+        hasActions = c.legal.any(axis=1)
+
+        backups = 0
+        self.residual = 0.0
+        frontier = np.nonzero(changed)[0]
+        if self.stats is not None:
+            self.stats.begin('replan')
+        for i in range(self.iterations):
+            if len(frontier) == 0:
+                break
+            # a frontier spanning much of the grid is cheaper as a full sweep
+            if len(frontier) > c.numStates // 4:
+                frontier = np.arange(c.numStates)
+                Q = c.qValues(V, self.discount, transitions=self.transitions)
+            else:
+                Q = c.qValues(V, self.discount, transitions=self.transitions, states=frontier)
+            newV = np.where(hasActions[frontier], Q.max(axis=1), 0.0)
+            change = np.abs(newV - V[frontier])
+            self.residual = change.max()
+            V[frontier] = newV
+            backups += len(frontier)
+            if self.stats is not None:
+                self.stats.record('backup', self.residual, statesTouched=len(frontier))
+
+            moved = frontier[change > self.tolerance]
+            if len(moved) > c.numStates // 4:
+                frontier = np.arange(c.numStates)
+            else:
+                frontier = c.predecessors(moved)
+
+        self.compiled = c
+        self.values = V
+        self.policyIds = c.greedyPolicy(c.qValues(V, self.discount, transitions=self.transitions))
+        self.snapshot()
+        return backups
+
+    def runSweeps(self, initialValues=None):
+        """
+        Reference implementation: one Python loop over states, actions
+        and successors per sweep, starting from 'initialValues' (a
+        dict, missing states start at 0) or from V = 0. Stops after
+        'iterations' sweeps or once max|V' - V| is at most 'tolerance'.
+        """
         states = self.mdp.getStates()
         number_states = len(states)
+        initialValues = initialValues or {}
         # *************
         #  TODO 2.1 a)
-        self.V = {key: 0 for key in states}
+        self.V = {key: initialValues.get(key, 0) for key in states}
         self.best_a = {s: self.mdp.getPossibleActions(s)[-1] if self.mdp.getPossibleActions(s) else None for s in states}
 
         # ************
 
-        for i in range(iterations):
-            print(f'Iteration number: {i}')
+        if self.stats is not None:
+            self.stats.begin('runSweeps')
+        for i in range(self.iterations):
+            if self.stats is None:
+                print(f'Iteration number: {i}')
+            previous = dict(self.best_a) if self.stats is not None else None
             newV = {}
             for s in states:
                 actions = self.mdp.getPossibleActions(s)
@@ -56,10 +179,64 @@ class ValueIterationAgent(Agent):
                     self.best_a[s] = best_a
                     newV[s] = max_value
 
+            residual = max(abs(newV[s] - self.V[s]) for s in states)
+            if self.stats is not None:
+                self.stats.record('sweep', residual, sum(previous[s] != self.best_a[s] for s in states),
+                                  number_states)
+
             # Update value function with new estimate
             self.V = newV
+            self.sweeps += 1
+            if residual <= self.tolerance:
+                break
             # ***************
 
+    def runVectorized(self):
+        """
+        Runs value iteration on the compiled arrays of the mdp, one
+        batched Bellman backup per sweep. Stops after 'iterations'
+        sweeps or once the sup-norm residual max|V' - V| drops to
+        'tolerance' or below (see CompiledGridworld.valueIteration).
+        """
+        self.compiled = self.mdp.compile()
+        if self.stats is not None:
+            self.stats.begin('runVectorized')
+        self.values, self.policyIds, sweeps, self.residual = self.compiled.valueIteration(
+            self.discount, self.iterations, self.tolerance, transitions=self.transitions, stats=self.stats)
+        self.sweeps += sweeps
+
+    def runParallel(self):
+        """
+        Same as runVectorized, but every sweep is split into bands of
+        grid rows that 'workers' processes back up concurrently.
+        """
+        from parallelPlanning import ParallelSweeper
+
+        self.compiled = self.mdp.compile()
+        sweeper = ParallelSweeper(self.compiled, self.workers)
+        try:
+            previous = np.zeros(self.compiled.numStates)
+            self.residual = np.inf
+            if self.stats is not None:
+                self.stats.begin('runParallel')
+            for i in range(self.iterations):
+                previous = sweeper.getValues()
+                self.residual = sweeper.valueSweep(self.discount)
+                self.sweeps += 1
+                if self.stats is not None:
+                    self.stats.record('sweep', self.residual, statesTouched=self.compiled.numStates)
+                if self.residual <= self.tolerance:
+                    break
+            self.values = sweeper.getValues()
+        finally:
+            sweeper.close()
+
+        if self.sweeps > 0:
+            Q = self.compiled.qValues(previous, self.discount, transitions=self.transitions)
+        else:
+            Q = np.where(self.compiled.legal, 0.0, -np.inf)
+        self.policyIds = self.compiled.greedyPolicy(Q)
+
     def getValue(self, state):
         """
         Look up the value of the state (after the indicated
@@ -67,6 +244,8 @@ class ValueIterationAgent(Agent):
         """
         # **********
         # TODO 2.2
+        if self.backend == 'numpy':
+            return self.values[self.compiled.stateId(state)]
         return self.V[state]
         # **********
 
@@ -80,6 +259,16 @@ class ValueIterationAgent(Agent):
         """
         # ***********
         # TODO 2.3.
+        if self.backend == 'numpy':
+            return self.qTable[self.compiled.stateId(state), self.compiled.actionIndex[action]]
+        return self.qTable[(state, action)]
+        # **********
+
+    def computeQValue(self, state, action):
+        """
+        One-step lookahead of 'action' in 'state' under the values
+        of the python backend.
+        """
         transition_states_and_probs = self.mdp.getTransitionStatesAndProbs(state, action)
         reward = self.mdp.getReward(state, action, None)
 
@@ -88,7 +277,6 @@ class ValueIterationAgent(Agent):
             q_value += i[1] * (reward + self.discount * self.V[i[0]])
 
         return q_value
-        # **********
 
     def getPolicy(self, state):
         """
@@ -96,15 +284,11 @@ class ValueIterationAgent(Agent):
         (after the indicated number of value iteration passes).
         """
 
-        actions = self.mdp.getPossibleActions(state)
-        if len(actions) < 1:
-            return None
-
-        else:
-
         # **********
         # TODO 2.4
-            return self.best_a[state]
+        if self.backend == 'numpy':
+            return self.policy[self.compiled.stateId(state)]
+        return self.policy[state]
         # ***********
 
     def getAction(self, state):
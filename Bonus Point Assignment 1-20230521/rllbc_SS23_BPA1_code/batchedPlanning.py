@@ -0,0 +1,37 @@
+import numpy as np
+
+
+# VALUE ITERATION ON MANY VARIANTS OF ONE GRID AT ONCE
+#
+# K variants of a grid share the successor table and differ only in their
+# probabilities, rewards and discount. Stacking those along a leading axis
+# turns K value iterations into one sequence of array operations, and
+# variants that have converged are dropped from the batch. The loop itself is
+# CompiledGridworld.valueIteration, shared with ValueIterationAgent.
+
+
+def stackVariants(compiled, settings):
+    """
+    Returns the discounts (K,), probabilities (K, S, A, slots) and
+    rewards (K, S, A) of the (discount, noise, livingReward) settings
+    on the layout of 'compiled'.
+    """
+    discounts = np.array([discount for discount, noise, livingReward in settings], dtype=float)
+    variants = [compiled.withParameters(noise, livingReward) for discount, noise, livingReward in settings]
+    probs = np.stack([v.probs for v in variants])
+    rewards = np.stack([v.rewards for v in variants])
+    return discounts, probs, rewards
+
+
+def solveBatch(compiled, settings, iterations=1000, tolerance=1e-8):
+    """
+    Value iteration on all settings at once, with the same backups
+    and stopping rule per variant as ValueIterationAgent.runVectorized
+    (see CompiledGridworld.valueIteration). Returns the values (K, S),
+    the greedy policy ids (K, S) and the number of sweeps of every
+    variant (K,).
+    """
+    discounts, probs, rewards = stackVariants(compiled, settings)
+    V, policyIds, sweeps, residuals = compiled.valueIteration(discounts, iterations, tolerance,
+                                                              variants=(probs, rewards))
+    return V, policyIds, sweeps
@@ -0,0 +1,179 @@
+import contextlib
+import csv
+import io
+import json
+import optparse
+import time
+import tracemalloc
+
+import numpy as np
+
+import gridworldGenerator
+from gridworld import GridworldEnvironment
+from PolicyIterationAgent import PolicyIterationAgent
+from QLearningAgent import QLearningAgent
+from ValueIterationAgent import ValueIterationAgent
+
+
+# SCALING BENCHMARK OF THE PLANNERS ON GENERATED GRIDS
+
+FIELDS = ['grid', 'rows', 'cols', 'states', 'agent', 'transitions', 'transitionMB', 'workers', 'buildSeconds',
+          'seconds', 'speedup', 'peakMemoryMB', 'sweeps', 'improvementSteps', 'episodes', 'steps', 'startValue']
+
+
+def runValueIteration(mdp, opts):
+    a = ValueIterationAgent(mdp, opts.discount, opts.iters, opts.tolerance, opts.backend, opts.transitions,
+                            opts.workers)
+    return a, {'sweeps': a.sweeps}
+
+
+def runPolicyIteration(mdp, opts):
+    a = PolicyIterationAgent(mdp, opts.discount, opts.iters, opts.evaluation, opts.tolerance or 1e-6,
+                             opts.transitions, opts.workers)
+    return a, {'sweeps': getattr(a, 'sweeps', ''), 'improvementSteps': a.improvementSteps}
+
+
+def runQLearning(mdp, opts):
+    """
+    Runs opts.episodes episodes of Q-learning, each cut off
+    after opts.maxSteps steps.
+    """
+    env = GridworldEnvironment(mdp)
+    a = QLearningAgent(env.getPossibleActions, opts.discount, opts.learningRate, opts.epsilon, opts.planningSteps)
+    steps = 0
+    for episode in range(opts.episodes):
+        env.reset()
+        for t in range(opts.maxSteps):
+            state = env.getCurrentState()
+            if len(env.getPossibleActions(state)) == 0:
+                break
+            action = a.getAction(state)
+            nextState, reward = env.doAction(action)
+            a.update(state, action, nextState, reward)
+            steps += 1
+    return a, {'episodes': opts.episodes, 'steps': steps}
+
+
+AGENTS = {'value': runValueIteration, 'policyiter': runPolicyIteration, 'q': runQLearning}
+
+
+def benchmark(kind, rows, cols, agent, opts):
+    """
+    Generates one grid and runs one agent on it. Returns a row of
+    FIELDS with the wall time of an untraced run and the peak memory
+    of a second, traced run, since tracemalloc slows down the python
+    loops several times over.
+    """
+    start = time.perf_counter()
+    options = {} if opts.wallDensity is None else {'wallDensity': opts.wallDensity}
+    mdp = gridworldGenerator.generateGrid(kind, rows, cols, opts.seed, **options)
+    mdp.setNoise(opts.noise)
+    mdp.setLivingReward(opts.livingReward)
+    buildSeconds = time.perf_counter() - start
+
+    np.random.seed(opts.seed)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        a, stats = AGENTS[agent](mdp, opts)
+    seconds = time.perf_counter() - start
+
+    np.random.seed(opts.seed)
+    mdp.clearCache()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        AGENTS[agent](mdp, opts)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    row = dict.fromkeys(FIELDS, '')
+    row.update(grid=kind, rows=len(mdp.grid), cols=len(mdp.grid[0]), states=len(mdp.getStates()), agent=agent,
+               buildSeconds=round(buildSeconds, 4), seconds=round(seconds, 4),
+               peakMemoryMB=round(peak / 2.0 ** 20, 3), startValue=a.getValue(mdp.getStartState()),
+               transitions=opts.transitions, workers=opts.workers,
+               transitionMB=round(mdp.compile().memoryReport()[opts.transitions] / 2.0 ** 20, 3))
+    row.update(stats)
+    return row
+
+
+def writeResults(results, path):
+    """
+    Writes the result rows to 'path' as JSON if it ends with
+    '.json' and as CSV otherwise.
+    """
+    with open(path, 'w', newline='') as f:
+        if path.endswith('.json'):
+            json.dump(results, f, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def parseOptions():
+    optParser = optparse.OptionParser(usage='python benchmark.py [options]')
+    optParser.add_option('-g', '--grids', action='store', type='string', dest='grids', default='maze,rooms',
+                         help='Comma separated grid kinds: maze, rooms, cliff, bridge (default %default)')
+    optParser.add_option('-s', '--sizes', action='store', type='string', dest='sizes', default='25,50,100',
+                         help='Comma separated side lengths of square grids (default %default)')
+    optParser.add_option('-a', '--agents', action='store', type='string', dest='agents', default='value,policyiter,q',
+                         help='Comma separated agents: value, policyiter, q (default %default)')
+    optParser.add_option('--seed', action='store', type='int', dest='seed', default=0,
+                         help='Seed of the grid generator and of the agents (default %default)')
+    optParser.add_option('--wallDensity', action='store', type='float', dest='wallDensity', default=None,
+                         help='Wall density passed to the generator: the share of inner walls kept for mazes, '
+                              'the obstacle probability for the other kinds (default: the generator default)')
+    optParser.add_option('-d', '--discount', action='store', type='float', dest='discount', default=0.99,
+                         help='Discount on future (default %default)')
+    optParser.add_option('-r', '--livingReward', action='store', type='float', dest='livingReward', default=0.0,
+                         help='Reward for living for a time step (default %default)')
+    optParser.add_option('-n', '--noise', action='store', type='float', dest='noise', default=0.2,
+                         help='How often action results in unintended direction (default %default)')
+    optParser.add_option('-i', '--iterations', action='store', type='int', dest='iters', default=100000,
+                         help='Maximum number of sweeps / evaluation rounds (default %default)')
+    optParser.add_option('--tolerance', action='store', type='float', dest='tolerance', default=1e-6,
+                         help='Convergence tolerance of the planners (default %default)')
+    optParser.add_option('--backend', action='store', type='choice', choices=['numpy', 'python'], dest='backend',
+                         default='numpy', help='Value iteration backend (default %default)')
+    optParser.add_option('--evaluation', action='store', type='choice', choices=['sweeps', 'exact', 'modified'],
+                         dest='evaluation', default='exact', help='Policy evaluation mode (default %default)')
+    optParser.add_option('--transitions', action='store', type='choice', choices=['padded', 'csr', 'dense'],
+                         dest='transitions', default='padded', help='Transition store of the planners (default %default)')
+    optParser.add_option('--workers', action='store', type='string', dest='workerCounts', default='1',
+                         help='Comma separated worker process counts of the planners; rows report their '
+                              'speedup over the first count (default %default)')
+    optParser.add_option('-k', '--episodes', action='store', type='int', dest='episodes', default=100,
+                         help='Number of Q-learning episodes (default %default)')
+    optParser.add_option('--maxSteps', action='store', type='int', dest='maxSteps', default=10000,
+                         help='Step limit of a Q-learning episode (default %default)')
+    optParser.add_option('-e', '--epsilon', action='store', type='float', dest='epsilon', default=0.3,
+                         help='Chance of taking a random action in q-learning (default %default)')
+    optParser.add_option('-l', '--learningRate', action='store', type='float', dest='learningRate', default=0.5,
+                         help='TD learning rate (default %default)')
+    optParser.add_option('--planningSteps', action='store', type='int', dest='planningSteps', default=0,
+                         help='Dyna-Q simulated updates per real Q-learning update (default %default)')
+    optParser.add_option('-o', '--output', action='store', type='string', dest='output', default='benchmark.csv',
+                         help='Result file, .csv or .json (default %default)')
+    opts, args = optParser.parse_args()
+    return opts
+
+
+if __name__ == '__main__':
+
+    opts = parseOptions()
+
+    results = []
+    for kind in opts.grids.split(','):
+        for size in [int(s) for s in opts.sizes.split(',')]:
+            for agent in opts.agents.split(','):
+                baseline = None
+                for workers in [int(w) for w in opts.workerCounts.split(',')]:
+                    opts.workers = workers
+                    row = benchmark(kind, size, size, agent, opts)
+                    baseline = baseline or row['seconds']
+                    row['speedup'] = round(baseline / max(row['seconds'], 1e-9), 3)
+                    print('%(grid)s %(rows)ix%(cols)i %(agent)s x%(workers)i: %(seconds).3fs (speedup %(speedup).2f), '
+                          '%(peakMemoryMB).1f MB, sweeps %(sweeps)s, episodes %(episodes)s' % row)
+                    results.append(row)
+
+    writeResults(results, opts.output)
+    print('Results written to ' + opts.output)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+from gridworldClass import Gridworld, CompiledGridworld
+
+
+# GRID MAPS ON DISK
+#
+# A map is a text file with one grid row per line and whitespace separated
+# cells: '.' is free, '#' is a wall, 'S' is the start and numbers are exit
+# states. A '.json' map holds the rows as a list of lists (or under "grid")
+# with the cell conventions of gridworld.py, where ' ' is free.
+#
+# The first load of a map compiles it and stores the arrays in an
+# uncompressed .npz beside the map, named after a hash of the map contents.
+# Later loads memory-map the arrays of that file and rebuild the grid from
+# them, so the map is neither parsed nor compiled; other noises and living
+# rewards only derive new probabilities and rewards (withParameters). If the
+# cache cannot be written, e.g. in a read-only directory, the map is simply
+# compiled on every load.
+
+CACHE_VERSION = 1  # bump when the compiled arrays change
+
+
+def parseCell(token):
+    if token in ('.', ' '):
+        return ' '
+    if token in ('#', 'S'):
+        return token
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+def parseMap(text, isJson=False):
+    """
+    Returns the grid (a list of rows) of a text or JSON map.
+    """
+    if isJson:
+        data = json.loads(text)
+        rows = data['grid'] if isinstance(data, dict) else data
+        grid = [[cell if isinstance(cell, (int, float)) else parseCell(cell) for cell in row] for row in rows]
+    else:
+        grid = [[parseCell(token) for token in line.split()] for line in text.splitlines() if line.strip()]
+    if not grid or any(len(row) != len(grid[0]) for row in grid):
+        raise ValueError('Map rows must be non-empty and of equal length')
+    return grid
+
+
+def cachePath(path, content):
+    """
+    The cache file of the map at 'path' with the given contents.
+    """
+    key = hashlib.sha256(content)
+    key.update(repr(CACHE_VERSION).encode())
+    return '%s.%s.npz' % (path, key.hexdigest()[:16])
+
+
+def saveArrays(path, arrays):
+    """
+    Writes the arrays as an uncompressed .npz, through a temporary
+    file so that readers never see a partial cache.
+    """
+    temporary = path + '.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def loadArrays(path):
+    """
+    Memory-maps every array of an uncompressed .npz. np.load ignores
+    mmap_mode for archives, so the members are mapped at their offsets
+    in the zip file directly.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('Cannot memory-map the compressed member %s' % info.filename)
+            f.seek(info.header_offset)
+            nameLength, extraLength = struct.unpack('<HH', f.read(30)[26:])
+            f.seek(info.header_offset + 30 + nameLength + extraLength)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            if shape == ():
+                arrays[name] = np.fromfile(f, dtype=dtype, count=1)[0]
+            else:
+                arrays[name] = np.memmap(f, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortranOrder else 'C')
+    return arrays
+
+
+def gridFromCompiled(compiled):
+    """
+    Rebuilds the grid rows of a CompiledGridworld. Integral exit
+    rewards become ints, as in a parsed map.
+    """
+    cells = np.full((compiled.rows, compiled.cols), '#', dtype=object)
+    rows, cols = compiled.stateRows[1:], compiled.stateCols[1:]
+    cells[rows, cols] = ' '
+
+    exitIds = np.nonzero(compiled.legal[:, compiled.actionIndex['exit']])[0]
+    rewards = compiled.rewards[exitIds, compiled.actionIndex['exit']].tolist()
+    cells[compiled.stateRows[exitIds], compiled.stateCols[exitIds]] = [
+        int(reward) if reward.is_integer() else reward for reward in rewards]
+    if compiled.startState is not None:
+        cells[compiled.stateRows[compiled.startState], compiled.stateCols[compiled.startState]] = 'S'
+    return cells.tolist()
+
+
+def loadMap(path, noise=0.2, livingReward=0.0, cache=True):
+    """
+    Returns the Gridworld of the map at 'path' with the given noise
+    and living reward, with its compiled arrays installed. With
+    'cache' the arrays come from the cache file when it can be read
+    and are written to it otherwise, if possible.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    cacheFile = cachePath(path, content)
+
+    compiled = None
+    if cache and os.path.exists(cacheFile):
+        try:
+            compiled = CompiledGridworld.fromArrays(loadArrays(cacheFile))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            compiled = None
+
+    if compiled is not None:
+        grid = Gridworld(gridFromCompiled(compiled))
+        if compiled.noise != noise or compiled.livingReward != livingReward:
+            compiled = compiled.withParameters(noise, livingReward)
+    else:
+        grid = Gridworld(parseMap(content.decode(), path.endswith('.json')))
+    grid.setLivingReward(livingReward)
+    grid.setNoise(noise)
+
+    if compiled is None:
+        compiled = grid.compile()
+        if cache:
+            try:
+                saveArrays(cacheFile, compiled.toArrays())
+            except OSError:
+                pass
+    grid.setCompiled(compiled)
+    return grid
+
+
+def writeMap(grid, path):
+    """
+    Writes the rows of 'grid' (a Gridworld or a list of rows) as a
+    text map.
+    """
+    rows = grid.grid if isinstance(grid, Gridworld) else grid
+    with open(path, 'w') as f:
+        for row in rows:
+            f.write(' '.join('.' if cell == ' ' else str(cell) for cell in row) + '\n')
@@ -1,5 +1,6 @@
 import optparse
 import sys
+import time
 
 import environment
 import mdp
@@ -8,9 +9,11 @@ from RandomAgent import RandomAgent
 import numpy as np
 
 # THE FOLLOWING AGENTS WILL BE COMPLETED DURING THE TASKS
-# from PolicyIterationAgent import PolicyIterationAgent  # TASK 1
-# from ValueIterationAgent import ValueIterationAgent  # TASK 2
-# from QLearningAgent import QLearningAgent  # TASK 3
+from PolicyIterationAgent import PolicyIterationAgent  # TASK 1
+from ValueIterationAgent import ValueIterationAgent  # TASK 2
+from QLearningAgent import QLearningAgent  # TASK 3
+from PrioritizedSweepingAgent import PrioritizedSweepingAgent
+from ArrayQLearningAgent import ArrayQLearningAgent
 
 
 # THE GRIDWORLD MAIN CODE AND TEST HARNESS
@@ -18,33 +21,133 @@ import numpy as np
 
 class GridworldEnvironment(environment.Environment):
 
-    def __init__(self, gridWorld):
+    def __init__(self, gridWorld, recorder=None):
+        """
+        With a TrajectoryRecorder every doAction is recorded, with
+        each reset starting the next episode number.
+        """
         self.gridWorld = gridWorld
+        self.recorder = recorder
+        self.compiled = None
+        self.getCompiled().cdf
+        self.episode = -1
         self.reset()
 
+    def getCompiled(self):
+        """
+        Returns the compiled gridworld, dropping the sampling
+        table if the noise or the living reward changed.
+        """
+        compiled = self.gridWorld.compile()
+        if compiled is not self.compiled:
+            self.compiled = compiled
+            self.samplingTable = {}
+        return compiled
+
     def getCurrentState(self):
         return self.state
 
     def getPossibleActions(self, state):
         return self.gridWorld.getPossibleActions(state)
 
+    def getSamplingEntry(self, state, action):
+        """
+        Returns (cdf, successors, reward, ids) for taking 'action' in
+        'state', read from the compiled arrays on first use. 'ids'
+        holds the state id, the action id and the successor ids.
+        """
+        compiled = self.getCompiled()
+        key = (state, action)
+        entry = self.samplingTable.get(key)
+        if entry is None:
+            s, a = compiled.stateId(state), compiled.actionIndex[action]
+            if not compiled.legal[s, a]:
+                raise ValueError('Illegal action %s in state %s' % (action, str(state)))
+            states = compiled.states
+            nextIds = compiled.nextStates[s, a].tolist()
+            entry = (compiled.cdf[s, a].tolist(),
+                     [states[n] for n in nextIds],
+                     self.gridWorld.getReward(state, action, None),
+                     (s, a, nextIds))
+            self.samplingTable[key] = entry
+        return entry
+
     def doAction(self, action):
-        successors = self.gridWorld.getTransitionStatesAndProbs(self.state, action)
-        sum = 0.0
+        cdf, successors, reward, ids = self.getSamplingEntry(self.state, action)
         rand = np.random.random()
-        state = self.getCurrentState()
-        for nextState, prob in successors:
-            sum += prob
-            if sum > 1.0:
-                raise 'Total transition probability more than one; sample failure.'
-            if rand < sum:
-                reward = self.gridWorld.getReward(state, action, nextState)
-                self.state = nextState
-                return (nextState, reward)
-        raise 'Total transition probability less than one; sample failure.'
+        k = 0
+        while rand >= cdf[k]:
+            k += 1
+        self.state = successors[k]
+        if self.recorder is not None:
+            s, a, nextIds = ids
+            self.recorder.record(self.episode, self.t, s, a, reward, nextIds[k])
+            self.t += 1
+        return (self.state, reward)
 
     def reset(self):
         self.state = self.gridWorld.getStartState()
+        self.episode += 1
+        self.t = 0
+
+
+class VectorizedGridworldEnvironment:
+    """
+    Runs 'numEnvs' independent episodes of a Gridworld in lockstep.
+
+    States and actions are the integer ids of the compiled gridworld
+    (see Gridworld.compile), so a step of all episodes is a handful of
+    array operations with a single call to the random generator.
+    With autoReset finished episodes restart from the start state.
+    """
+
+    def __init__(self, gridWorld, numEnvs, autoReset=True):
+        self.gridWorld = gridWorld
+        self.numEnvs = numEnvs
+        self.autoReset = autoReset
+        self.gridWorld.compile().cdf
+        self.reset()
+
+    def getCurrentStates(self):
+        return self.states
+
+    def getLegalActions(self):
+        """
+        Returns a (numEnvs, numActions) mask of the actions that are
+        possible in the current states.
+        """
+        return self.gridWorld.compile().legal[self.states]
+
+    def step(self, actions):
+        """
+        Takes action ids 'actions' in all current states at once.
+
+        Returns (nextStates, rewards, dones) as arrays. nextStates are
+        the sampled successors, so finished episodes report the
+        terminal state (id 0) even when they have been reset already.
+        """
+        compiled = self.gridWorld.compile()
+        states = self.states
+        if not compiled.legal[states, actions].all():
+            raise ValueError('Illegal action in vectorized step')
+
+        rand = np.random.random(self.numEnvs)
+        slots = (rand[:, None] >= compiled.cdf[states, actions]).sum(axis=1)
+        np.minimum(slots, compiled.SLOTS - 1, out=slots)
+        nextStates = compiled.nextStates[states, actions, slots]
+        rewards = compiled.rewards[states, actions]
+        dones = nextStates == 0
+
+        self.states = nextStates.copy()
+        if self.autoReset:
+            self.states[dones] = compiled.startState
+        return nextStates, rewards, dones
+
+    def reset(self):
+        startState = self.gridWorld.compile().startState
+        if startState is None:
+            raise ValueError('Grid has no start state')
+        self.states = np.full(self.numEnvs, startState, dtype=np.int32)
 
 
 # THE FOLLOWING GRIDS WILL BE USED THOUGHT OUT THE TASKS
@@ -144,7 +247,7 @@ def runEpisode(agent, environment, discount, decision, display, message, pause,
         # GET ACTION (USUALLY FROM AGENT)
         action = decision(state)
         if action == None:
-            raise 'Error: Agent returned None action'
+            raise RuntimeError('Error: Agent returned None action')
 
         # EXECUTE ACTION
         nextState, reward = environment.doAction(action)
@@ -159,6 +262,110 @@ def runEpisode(agent, environment, discount, decision, display, message, pause,
         totalDiscount *= discount
 
 
+def runEpisodesHeadless(agent, environment, episodes, discount, decision=None, maxSteps=None, trajectories=False):
+    """
+    Runs 'episodes' episodes like runEpisode, but without display,
+    messages or pauses. Episodes are cut off after 'maxSteps' steps
+    if given. Returns a dict with the discounted 'returns' and the
+    'lengths' of all episodes as arrays, the total 'steps', the
+    'seconds' taken and 'stepsPerSecond'.
+
+    With trajectories=True it also holds the 'states', 'actions'
+    (compiled ids) and 'rewards' of all steps, with episode i at
+    offsets[i]:offsets[i + 1].
+    """
+    if decision is None:
+        decision = agent.getAction
+    compiled = environment.getCompiled()
+    returns = np.zeros(episodes)
+    lengths = np.zeros(episodes, dtype=np.int64)
+    stateIds = np.empty(1024, dtype=np.int32)
+    actionIds = np.empty(1024, dtype=np.int8)
+    rewards = np.empty(1024)
+
+    steps = 0
+    start = time.perf_counter()
+    for episode in range(episodes):
+        environment.reset()
+        total, totalDiscount, t = 0.0, 1.0, 0
+        while maxSteps is None or t < maxSteps:
+            state = environment.getCurrentState()
+            if len(environment.getPossibleActions(state)) == 0:
+                break
+            action = decision(state)
+            if action is None:
+                raise RuntimeError('Error: Agent returned None action')
+            nextState, reward = environment.doAction(action)
+            agent.update(state, action, nextState, reward)
+
+            if trajectories:
+                if steps + t == len(stateIds):
+                    stateIds, actionIds, rewards = [np.concatenate((x, np.empty_like(x)))
+                                                    for x in (stateIds, actionIds, rewards)]
+                stateIds[steps + t] = compiled.stateId(state)
+                actionIds[steps + t] = compiled.actionIndex[action]
+                rewards[steps + t] = reward
+            total += reward * totalDiscount
+            totalDiscount *= discount
+            t += 1
+        returns[episode] = total
+        lengths[episode] = t
+        steps += t
+    seconds = time.perf_counter() - start
+
+    result = {'returns': returns, 'lengths': lengths, 'steps': steps, 'seconds': seconds,
+              'stepsPerSecond': steps / seconds if seconds > 0 else float('inf')}
+    if trajectories:
+        result.update(states=stateIds[:steps], actions=actionIds[:steps], rewards=rewards[:steps],
+                      offsets=np.concatenate(([0], np.cumsum(lengths))))
+    return result
+
+
+def runBatchedQLearning(agent, environment, episodes, discount, recorder=None):
+    """
+    Trains an ArrayQLearningAgent on a VectorizedGridworldEnvironment
+    until 'episodes' episodes have finished. Every step takes
+    epsilon-greedy actions in all environments and applies their TD
+    updates as one batch. Returns the discounted return of each
+    finished episode in the order the episodes finished.
+
+    With a TrajectoryRecorder every step of every environment is
+    recorded. Episode numbers are handed out as episodes start, so
+    the records of one episode share a number but are interleaved
+    with those of the other environments.
+    """
+    numEnvs = environment.numEnvs
+    returns = np.zeros(numEnvs)
+    totalDiscounts = np.ones(numEnvs)
+    episodeIds = np.arange(numEnvs)
+    t = np.zeros(numEnvs, dtype=np.int64)
+    finished = []
+    numFinished = 0
+    environment.reset()
+    while numFinished < episodes:
+        states = environment.getCurrentStates()
+        actions = agent.getActionIds(states)
+        nextStates, rewards, dones = environment.step(actions)
+        agent.updateBatch(states, actions, nextStates, rewards)
+        if recorder is not None:
+            recorder.recordBatch(episodeIds, t, states, actions, rewards, nextStates)
+            t += 1
+        returns += rewards * totalDiscounts
+        totalDiscounts *= discount
+
+        if dones.any():
+            finished.append(returns[dones])
+            returns[dones] = 0.0
+            totalDiscounts[dones] = 1.0
+            numDone = int(dones.sum())
+            episodeIds[dones] = numEnvs + numFinished + np.arange(numDone)
+            t[dones] = 0
+            numFinished += numDone
+    if not finished:
+        return np.zeros(0)
+    return np.concatenate(finished)[:episodes]
+
+
 # DEFINITION OF PARAMETER OPTIONS
 
 def parseOptions():
@@ -176,6 +383,17 @@ def parseOptions():
     optParser.add_option('-e', '--epsilon', action='store',
                          type='float', dest='epsilon', default=0.3,
                          metavar="E", help='Chance of taking a random action in q-learning (default %default)')
+    optParser.add_option('--planningSteps', action='store',
+                         type='int', dest='planningSteps', default=0,
+                         metavar="K", help='Simulated updates from a learned model after every real update of the ' +
+                                           '\'q\' agent, i.e. Dyna-Q (default %default)')
+    optParser.add_option('--float32', action='store_true',
+                         dest='float32', default=False,
+                         help='Keep the Q-table of the \'qarray\' agent in float32')
+    optParser.add_option('--numEnvs', action='store',
+                         type='int', dest='numEnvs', default=1,
+                         metavar="N", help='Train the \'qarray\' agent on N episodes in lockstep with batched ' +
+                                           'updates and no display per step (default %default)')
     optParser.add_option('-l', '--learningRate', action='store',
                          type='float', dest='learningRate', default=0.5,
                          metavar="P", help='TD learning rate (default %default)')
@@ -183,17 +401,39 @@ def parseOptions():
                          type='int', dest='iters', default=10,
                          metavar="K",
                          help='Number of rounds of policy evaluation or value iteration (default %default)')
+    optParser.add_option('--tolerance', action='store',
+                         type='float', dest='tolerance', default=0.0,
+                         metavar="T", help='Stop value iteration once no value changes by more than T; also the threshold of ' +
+                                           'modified policy iteration (1e-6 if T is 0) and prioritized sweeping ' +
+                                           '(1e-5 if T is 0) (default %default)')
+    optParser.add_option('--evaluation', action='store',
+                         type='choice', choices=['sweeps', 'exact', 'modified'], dest='evaluation', default='sweeps',
+                         help='Policy evaluation of policy iteration: \'sweeps\', \'exact\' sparse solve or ' +
+                              '\'modified\' in-place sweeps (default %default)')
+    optParser.add_option('--transitions', action='store',
+                         type='choice', choices=['padded', 'csr', 'dense'], dest='transitions', default='padded',
+                         help='Transition store of the array based planners: \'padded\', \'csr\' or \'dense\' ' +
+                              '(default %default)')
+    optParser.add_option('--workers', action='store',
+                         type='int', dest='workers', default=1,
+                         metavar="W", help='Worker processes of the array based value iteration and of policy ' +
+                                           'iteration with \'sweeps\' evaluation (default %default)')
+    optParser.add_option('--stats', action='store',
+                         type='string', dest='stats', default=None,
+                         metavar="F", help='Write per-iteration residuals, policy changes and timings of the value ' +
+                                           'and policyiter agents to F, .json or .csv')
     optParser.add_option('-k', '--episodes', action='store',
                          type='int', dest='episodes', default=0,
                          metavar="K", help='Number of epsiodes of the MDP to run (default %default)')
     optParser.add_option('-g', '--grid', action='store',
                          metavar="G", type='string', dest='grid', default="BookGrid",
-                         help='Grid to use (case sensitive; options are BookGrid, BridgeGrid, CliffGrid, MazeGrid, CustomGrid, default %default)')
+                         help='Grid to use (case sensitive; options are BookGrid, BridgeGrid, CliffGrid, MazeGrid, CustomGrid or file:PATH for a map file, default %default)')
     optParser.add_option('-w', '--windowSize', metavar="X", type='int', dest='gridSize', default=150,
                          help='Request a window width of X pixels *per grid cell* (default %default)')
     optParser.add_option('-a', '--agent', action='store', metavar="A",
                          type='string', dest='agent', default="random",
-                         help='Agent type (options are \'random\', \'value\' , \'policyiter\' and \'q\', default %default)')
+                         help='Agent type (options are \'random\', \'value\' , \'policyiter\', \'prioritized\', \'q\' ' +
+                              'and \'qarray\', default %default)')
     optParser.add_option('-t', '--text', action='store_true',
                          dest='textDisplay', default=False,
                          help='Use text-only ASCII display')
@@ -206,6 +446,15 @@ def parseOptions():
     optParser.add_option('-s', '--speed', action='store', metavar="S", type=float,
                          dest='speed', default=1.0,
                          help='Speed of animation, S > 1.0 is faster, 0.0 < S < 1.0 is slower (default %default)')
+    optParser.add_option('--headless', action='store_true',
+                         dest='headless', default=False,
+                         help='Run the episodes without display, messages or pauses and report steps per second')
+    optParser.add_option('--record', action='store', metavar="F",
+                         type='string', dest='record', default=None,
+                         help='Record every step of the episodes as binary records in the .npy file F')
+    optParser.add_option('--evaluate', action='store', metavar="M",
+                         type='int', dest='evaluate', default=0,
+                         help='Evaluate the final policy of the agent by M vectorized rollouts (default %default)')
     optParser.add_option('-m', '--manual', action='store_true',
                          dest='manual', default=False,
                          help='Manually control agent (for lecture)')
@@ -213,6 +462,15 @@ def parseOptions():
     opts, args = optParser.parse_args()
 
     # MANAGE CONFLICTS
+    if opts.stats and opts.agent not in ['value', 'policyiter']:
+        optParser.error('--stats is only supported by the value and policyiter agents')
+    if opts.evaluate > 0 and opts.agent == 'random':
+        optParser.error('--evaluate is not supported by the random agent, which has no policy')
+
+    if opts.headless:
+        opts.textDisplay = True
+        opts.quiet = True
+
     if opts.textDisplay or opts.quiet:
         opts.pause = False
         opts.manual = False
@@ -233,11 +491,21 @@ if __name__ == '__main__':
 
     import gridworld
 
-    mdpFunction = getattr(gridworld, "get" + opts.grid)
-    mdp = mdpFunction()
-    mdp.setLivingReward(opts.livingReward)
-    mdp.setNoise(opts.noise)
-    env = gridworld.GridworldEnvironment(mdp)
+    if opts.grid.startswith('file:'):
+        from gridMaps import loadMap
+
+        mdp = loadMap(opts.grid[len('file:'):], opts.noise, opts.livingReward)
+    else:
+        mdpFunction = getattr(gridworld, "get" + opts.grid)
+        mdp = mdpFunction()
+        mdp.setLivingReward(opts.livingReward)
+        mdp.setNoise(opts.noise)
+    recorder = None
+    if opts.record:
+        from trajectoryRecorder import TrajectoryRecorder
+
+        recorder = TrajectoryRecorder(opts.record)
+    env = gridworld.GridworldEnvironment(mdp, recorder)
 
     ###########################
     # GET THE DISPLAY ADAPTER
@@ -257,20 +525,39 @@ if __name__ == '__main__':
     ###########################
     np.random.seed(42)
 
+    stats = None
+    if opts.stats:
+        from planningStats import PlanningStats
+
+        stats = PlanningStats()
+
     a = None
     if opts.agent == 'value':
-        a = ValueIterationAgent(mdp, opts.discount, opts.iters)
+        a = ValueIterationAgent(mdp, opts.discount, opts.iters, opts.tolerance, transitions=opts.transitions,
+                                workers=opts.workers, stats=stats)
     elif opts.agent == 'policyiter':
-        a = PolicyIterationAgent(mdp, opts.discount, opts.iters)
+        a = PolicyIterationAgent(mdp, opts.discount, opts.iters, opts.evaluation, opts.tolerance or 1e-6,
+                                 opts.transitions, opts.workers, stats)
+    elif opts.agent == 'prioritized':
+        a = PrioritizedSweepingAgent(mdp, opts.discount, opts.iters, opts.tolerance or 1e-5)
     elif opts.agent == 'q':
-        a = QLearningAgent(env.getPossibleActions, opts.discount, opts.learningRate, opts.epsilon)
+        a = QLearningAgent(env.getPossibleActions, opts.discount, opts.learningRate, opts.epsilon, opts.planningSteps)
+    elif opts.agent == 'qarray':
+        a = ArrayQLearningAgent(env.getCompiled(), opts.discount, opts.learningRate, opts.epsilon,
+                                np.float32 if opts.float32 else np.float64)
     elif opts.agent == 'random':
         # No reason to use the random agent without episodes
         if opts.episodes == 0:
             opts.episodes = 1
         a = RandomAgent(mdp.getPossibleActions)
     else:
-        raise 'Unknown agent type: ' + opts.agent
+        raise ValueError('Unknown agent type: ' + opts.agent)
+    if stats is not None:
+        stats.write(opts.stats)
+        for run, summary in stats.summary().items():
+            print("%s: %i ITERATIONS, %i STATE BACKUPS, RESIDUAL %s IN %.3fs" % (
+                run, summary['iterations'], summary['statesTouched'], summary['residual'], summary['seconds']))
+        print("PLANNING STATS WRITTEN TO " + opts.stats)
 
     ###########################
     # RUN EPISODES
@@ -283,7 +570,7 @@ if __name__ == '__main__':
         f.write('\n\n Testing the %s on the %s \n\n ' % (agent_name, opts.grid))
 
     # DISPLAY Q/V VALUES BEFORE SIMULATION OF EPISODES
-    if opts.agent in ['value', 'policyiter']:
+    if opts.agent in ['value', 'policyiter', 'prioritized']:
         display.displayValues(a, message="VALUES AFTER " + str(opts.iters) + " ITERATIONS")
         display.pause()
         display.displayQValues(a, message="Q-VALUES AFTER " + str(opts.iters) + " ITERATIONS")
@@ -296,9 +583,11 @@ if __name__ == '__main__':
                                                                                          False)
         if opts.agent == 'policyiter': displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES",
                                                                                              False)
+        if opts.agent == 'prioritized': displayCallback = lambda state: display.displayValues(a, state,
+                                                                                              "CURRENT VALUES", False)
         if opts.agent == 'value': displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES",
                                                                                         False)
-        if opts.agent == 'q': displayCallback = lambda state: display.displayQValues(a, state, "CURRENT Q-VALUES",
+        if opts.agent in ['q', 'qarray']: displayCallback = lambda state: display.displayQValues(a, state, "CURRENT Q-VALUES",
                                                                                      False)
 
     messageCallback = lambda x: printString(x)
@@ -321,17 +610,39 @@ if __name__ == '__main__':
         print("RUNNING", opts.episodes, "EPISODES")
         print()
     returns = 0
-    for episode in range(1, opts.episodes + 1):
-        returns += runEpisode(a, env, opts.discount, decisionCallback, displayCallback, messageCallback, pauseCallback,
-                              episode)
+    if opts.agent == 'qarray' and opts.numEnvs > 1:
+        vectorizedEnv = VectorizedGridworldEnvironment(mdp, opts.numEnvs)
+        returns = runBatchedQLearning(a, vectorizedEnv, opts.episodes, opts.discount, recorder).sum()
+    elif opts.headless and opts.episodes > 0:
+        result = runEpisodesHeadless(a, env, opts.episodes, opts.discount, decisionCallback)
+        returns = result['returns'].sum()
+        print("MEAN EPISODE LENGTH: %.3f, %i STEPS IN %.3fs (%.0f STEPS/S)" % (
+            result['lengths'].mean(), result['steps'], result['seconds'], result['stepsPerSecond']))
+    else:
+        for episode in range(1, opts.episodes + 1):
+            returns += runEpisode(a, env, opts.discount, decisionCallback, displayCallback, messageCallback,
+                                  pauseCallback, episode)
     if opts.episodes > 0:
         print()
         print("AVERAGE RETURNS FROM START STATE: " + str((returns + 0.0) / opts.episodes))
         print()
         print()
+    if recorder is not None:
+        recorder.close()
+        print("RECORDED %i STEPS TO %s" % (len(recorder), opts.record))
+    if opts.evaluate > 0:
+        from policyEvaluation import evaluatePolicy
+
+        result = evaluatePolicy(mdp, a, opts.evaluate, opts.discount)
+        print("EVALUATED POLICY WITH %i ROLLOUTS IN %.3fs" % (opts.evaluate, result['seconds']))
+        print("MEAN RETURN FROM START STATE: %.4f, 95%% CI [%.4f, %.4f], STD %.4f" % (
+            result['mean'], result['ci'][0], result['ci'][1], result['std']))
+        print("EPISODE LENGTH: MEAN %.3f, MAX %i, %i TRUNCATED" % (
+            result['meanLength'], result['maxLength'], result['truncated']))
+        print()
 
     # DISPLAY POST-LEARNING VALUES / Q-VALUES
-    if opts.agent == 'q' and not opts.manual:
+    if opts.agent in ['q', 'qarray'] and not opts.manual:
         display.displayQValues(a, message="Q-VALUES AFTER " + str(opts.episodes) + " EPISODES")
         display.pause()
         display.displayValues(a, message="VALUES AFTER " + str(opts.episodes) + " EPISODES")
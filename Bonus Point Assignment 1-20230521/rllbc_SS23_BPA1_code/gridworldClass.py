@@ -1,6 +1,13 @@
+import copy
+
+import numpy as np
+
 import mdp
 import util
 
+# FIXED ORDER OF ACTION IDS USED BY THE COMPILED ARRAYS
+ACTIONS = ('north', 'west', 'south', 'east', 'exit')
+
 
 class Gridworld(mdp.MarkovDecisionProcess):
 
@@ -15,6 +22,15 @@ class Gridworld(mdp.MarkovDecisionProcess):
         self.livingReward = 0.0
         self.noise = 0.2
 
+        # compiled array view, rebuilt lazily by compile()
+        self.compiled = None
+
+        # memoized transitions and rewards, see clearCache()
+        self.transitionCache = {}
+        self.rewardCache = {}
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
     def setLivingReward(self, reward):
         """
         The (negative) reward for exiting "normal" states.
@@ -24,12 +40,73 @@ class Gridworld(mdp.MarkovDecisionProcess):
         future rewards.
         """
         self.livingReward = reward
+        self.clearCache()
 
     def setNoise(self, noise):
         """
         The probability of moving in an unintended direction.
         """
         self.noise = noise
+        self.clearCache()
+
+    def setCell(self, row, col, value):
+        """
+        Changes the grid cell at (row, col), e.g. to '#' for a
+        new wall or to a number for a new exit state.
+
+        Edit the grid through this method rather than through
+        self.grid so that cached transitions are dropped.
+        """
+        self.grid[row][col] = value
+        self.clearCache()
+
+    def clearCache(self):
+        """
+        Drops the memoized transitions and rewards and the
+        compiled arrays. Called by every method that changes
+        the layout or the parameters.
+        """
+        self.transitionCache.clear()
+        self.rewardCache.clear()
+        self.compiled = None
+
+    def getCacheStats(self):
+        """
+        Returns the number of cache hits and misses of
+        getTransitionStatesAndProbs and getReward together
+        with the number of cached entries.
+        """
+        return {'hits': self.cacheHits,
+                'misses': self.cacheMisses,
+                'entries': len(self.transitionCache) + len(self.rewardCache)}
+
+    def compile(self):
+        """
+        Returns a CompiledGridworld holding dense integer state ids
+        and the transition / reward arrays for the current noise
+        and living reward.
+
+        The arrays are built once and reused until one of the
+        parameters changes.
+        """
+        compiled = self.compiled
+        if compiled is None or compiled.noise != self.noise or compiled.livingReward != self.livingReward:
+            compiled = CompiledGridworld(self)
+            self.compiled = compiled
+        return compiled
+
+    def setCompiled(self, compiled):
+        """
+        Installs a CompiledGridworld of this grid, e.g. one loaded
+        from a cache, so that compile() returns it instead of
+        building the arrays. It must match the current noise and
+        living reward.
+        """
+        if (compiled.rows, compiled.cols) != (self.rows, self.cols):
+            raise ValueError('Compiled grid has a different size')
+        if compiled.noise != self.noise or compiled.livingReward != self.livingReward:
+            raise ValueError('Compiled grid has different parameters')
+        self.compiled = compiled
 
     def getPossibleActions(self, state):
         """
@@ -64,21 +141,34 @@ class Gridworld(mdp.MarkovDecisionProcess):
         Note that the reward depends only on the state being
         departed (as in the R+N book examples, which more or
         less use this convention).
+
+        Results are memoized per state until the next
+        parameter or grid change.
         """
+        reward = self.rewardCache.get(state)
+        if reward is not None:
+            self.cacheHits += 1
+            return reward
+        self.cacheMisses += 1
+
         if state == self.terminalState:
-            return 0.0
-        row, col = state
-        cell = self.grid[row][col]
-        if type(cell) == int or type(cell) == float:
-            return cell
-        return self.livingReward
+            reward = 0.0
+        else:
+            row, col = state
+            cell = self.grid[row][col]
+            if type(cell) == int or type(cell) == float:
+                reward = cell
+            else:
+                reward = self.livingReward
+        self.rewardCache[state] = reward
+        return reward
 
     def getStartState(self):
         for row in range(self.rows):
             for col in range(self.cols):
                 if self.grid[row][col] == 'S':
                     return (row, col)
-        raise 'Grid has no start state'
+        raise ValueError('Grid has no start state')
 
     def isTerminal(self, state):
         """
@@ -96,10 +186,25 @@ class Gridworld(mdp.MarkovDecisionProcess):
         representing the states reachable
         from 'state' by taking 'action' along
         with their transition probabilities.
+
+        Results are memoized per (state, action) until the
+        next parameter or grid change, so callers must not
+        modify the returned list.
         """
+        key = (state, action)
+        successors = self.transitionCache.get(key)
+        if successors is not None:
+            self.cacheHits += 1
+            return successors
+        self.cacheMisses += 1
 
+        successors = self.__computeTransitionStatesAndProbs(state, action)
+        self.transitionCache[key] = successors
+        return successors
+
+    def __computeTransitionStatesAndProbs(self, state, action):
         if action not in self.getPossibleActions(state):
-            raise "Illegal action!"
+            raise ValueError('Illegal action!')
 
         if state == self.terminalState:
             return []
@@ -154,3 +259,478 @@ class Gridworld(mdp.MarkovDecisionProcess):
         if row < 0 or row >= self.rows: return False
         if col < 0 or col >= self.cols: return False
         return self.grid[row][col] != '#'
+
+
+class CompiledGridworld:
+    """
+    Array view of a Gridworld.
+
+    States get dense integer ids in the order of Gridworld.getStates(),
+    so id 0 is the terminal state and the remaining ids follow the
+    non-wall cells in row-major order. Actions get the ids of ACTIONS.
+
+    Every (state, action) pair has at most three distinct successors,
+    so the transitions are stored as a padded successor table:
+
+    nextStates[s, a, k]   id of the k-th successor (0 in unused slots)
+    probs[s, a, k]        its probability (0.0 in unused slots)
+    rewards[s, a]         reward for taking a in s
+    legal[s, a]           True if a is a possible action in s
+    slips[s, a, k]        how many of the two slips end in slot k
+
+    The successors of each pair appear in the same order and with the
+    same aggregated probabilities as in getTransitionStatesAndProbs.
+
+    The padded table grows linearly with the number of states. For
+    planning, the same transitions can also be read as a CSR matrix
+    (transitionMatrix) or, for small grids, as a dense P[s, a, s']
+    (denseTransitions), which are built on top of the padded table;
+    see memoryReport for the memory of each.
+
+    The successor layout does not depend on the noise or the living
+    reward, so withParameters derives the arrays of other settings
+    without compiling the grid again.
+    """
+
+    SLOTS = 3
+    TRANSITIONS = ('padded', 'csr', 'dense')
+    ARRAYS = ('cellIndex', 'stateRows', 'stateCols', 'nextStates', 'probs', 'rewards', 'legal', 'slips')
+
+    def __init__(self, gridworld):
+        self.noise = gridworld.noise
+        self.livingReward = gridworld.livingReward
+        self.rows = gridworld.rows
+        self.cols = gridworld.cols
+        self.actions = ACTIONS
+        self.actionIndex = {action: i for i, action in enumerate(ACTIONS)}
+
+        # cell layout
+        isWall = np.zeros((self.rows, self.cols), dtype=bool)
+        isExit = np.zeros((self.rows, self.cols), dtype=bool)
+        exitReward = np.zeros((self.rows, self.cols))
+        start = None
+        for row, line in enumerate(gridworld.grid):
+            for col, cell in enumerate(line):
+                if cell == '#':
+                    isWall[row, col] = True
+                elif type(cell) == int or type(cell) == float:
+                    isExit[row, col] = True
+                    exitReward[row, col] = cell
+                elif cell == 'S' and start is None:
+                    start = (row, col)
+
+        # state ids, -1 marks walls
+        self.cellIndex = np.full((self.rows, self.cols), -1, dtype=np.int32)
+        stateRows, stateCols = np.nonzero(~isWall)
+        self.numStates = len(stateRows) + 1
+        self.cellIndex[stateRows, stateCols] = np.arange(1, self.numStates, dtype=np.int32)
+        self.stateRows = np.concatenate(([-1], stateRows)).astype(np.int32)
+        self.stateCols = np.concatenate(([-1], stateCols)).astype(np.int32)
+        self.startState = None if start is None else int(self.cellIndex[start])
+        self._states = None
+        self._cdf = None
+        self._csr = None
+        self._dense = None
+        self._incoming = None
+
+        ids = np.arange(1, self.numStates, dtype=np.int32)
+        exits = isExit[stateRows, stateCols]
+
+        # neighbour ids, moving into a wall or off the grid means staying put
+        padded = np.full((self.rows + 2, self.cols + 2), -1, dtype=np.int32)
+        padded[1:-1, 1:-1] = self.cellIndex
+        north = padded[stateRows, stateCols + 1]
+        west = padded[stateRows + 1, stateCols]
+        south = padded[stateRows + 2, stateCols + 1]
+        east = padded[stateRows + 1, stateCols + 2]
+        north = np.where(north < 0, ids, north)
+        west = np.where(west < 0, ids, west)
+        south = np.where(south < 0, ids, south)
+        east = np.where(east < 0, ids, east)
+
+        numStates, numActions, slots = self.numStates, len(ACTIONS), self.SLOTS
+        self.nextStates = np.zeros((numStates, numActions, slots), dtype=np.int32)
+        self.probs = np.zeros((numStates, numActions, slots))
+        self.rewards = np.zeros((numStates, numActions))
+        self.legal = np.zeros((numStates, numActions), dtype=bool)
+        self.slips = np.zeros((numStates, numActions, slots), dtype=np.int8)
+
+        # intended direction first, then the two perpendicular slips
+        moves = {'north': (north, west, east),
+                 'west': (west, north, south),
+                 'south': (south, west, east),
+                 'east': (east, north, south)}
+        slip = self.noise / 2.0
+        for action, targets in moves.items():
+            a = self.actionIndex[action]
+            succ = np.stack(targets, axis=1)
+            prob = np.empty(succ.shape)
+            prob[:, 0] = 1 - self.noise
+            prob[:, 1:] = slip
+            count = np.zeros(succ.shape, dtype=np.int8)
+            count[:, 1:] = 1
+            # aggregate successors that coincide with an earlier slot
+            valid = np.ones(succ.shape, dtype=bool)
+            for k in range(1, slots):
+                for j in range(k):
+                    same = valid[:, k] & valid[:, j] & (succ[:, k] == succ[:, j])
+                    prob[same, j] += prob[same, k]
+                    count[same, j] += count[same, k]
+                    valid[same, k] = False
+            # compact the slots so that successors keep their order
+            order = np.argsort(~valid, axis=1, kind='stable')
+            valid = np.take_along_axis(valid, order, axis=1)
+            succ = np.where(valid, np.take_along_axis(succ, order, axis=1), 0)
+            prob = np.where(valid, np.take_along_axis(prob, order, axis=1), 0.0)
+            count = np.where(valid, np.take_along_axis(count, order, axis=1), 0)
+            self.nextStates[ids, a] = np.where(exits[:, None], 0, succ)
+            self.probs[ids, a] = np.where(exits[:, None], 0.0, prob)
+            self.slips[ids, a] = np.where(exits[:, None], 0, count)
+            self.legal[ids, a] = ~exits
+            self.rewards[ids, a] = np.where(exits, 0.0, self.livingReward)
+
+        # exit states move to the terminal state under 'exit'
+        exitIds = ids[exits]
+        a = self.actionIndex['exit']
+        self.probs[exitIds, a, 0] = 1.0
+        self.legal[exitIds, a] = True
+        self.rewards[exitIds, a] = exitReward[stateRows[exits], stateCols[exits]]
+
+    def toArrays(self):
+        """
+        Returns the arrays that define this compile as a dict, with
+        the parameters and the start state (-1 for none) as scalars,
+        e.g. for np.savez.
+        """
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays['noise'] = np.float64(self.noise)
+        arrays['livingReward'] = np.float64(self.livingReward)
+        arrays['startState'] = np.int32(-1 if self.startState is None else self.startState)
+        return arrays
+
+    @classmethod
+    def fromArrays(cls, arrays):
+        """
+        Rebuilds a CompiledGridworld from the dict of toArrays. The
+        arrays are used as they are, so memory maps stay memory maps.
+        """
+        compiled = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(compiled, name, arrays[name])
+        compiled.noise = float(arrays['noise'])
+        compiled.livingReward = float(arrays['livingReward'])
+        startState = int(arrays['startState'])
+        compiled.startState = None if startState < 0 else startState
+        compiled.rows, compiled.cols = compiled.cellIndex.shape
+        compiled.numStates = len(compiled.stateRows)
+        compiled.actions = ACTIONS
+        compiled.actionIndex = {action: i for i, action in enumerate(ACTIONS)}
+        compiled._states = compiled._cdf = compiled._csr = compiled._dense = compiled._incoming = None
+        return compiled
+
+    def withParameters(self, noise, livingReward):
+        """
+        Returns a CompiledGridworld of the same grid with another
+        noise and living reward. The successor table and the other
+        layout arrays are shared with this one, only probs and
+        rewards are new.
+        """
+        other = copy.copy(self)
+        other.noise = noise
+        other.livingReward = livingReward
+        other._cdf = other._csr = other._dense = other._incoming = None
+
+        moves = self.legal[:, :-1]
+        other.probs = self.probs.copy()
+        other.probs[:, :-1] = self.slips[:, :-1] * (noise / 2.0)
+        other.probs[:, :-1, 0] += np.where(moves, 1 - noise, 0.0)
+        other.rewards = self.rewards.copy()
+        other.rewards[:, :-1] = np.where(moves, livingReward, 0.0)
+        return other
+
+    @property
+    def states(self):
+        """
+        List of state tuples indexed by state id.
+        """
+        if self._states is None:
+            self._states = [(-1, -1)] + list(zip(self.stateRows[1:].tolist(), self.stateCols[1:].tolist()))
+        return self._states
+
+    @property
+    def cdf(self):
+        """
+        Cumulative successor probabilities cdf[s, a, k], built on
+        first use. Rows of legal actions end at exactly 1.0, so a
+        uniform draw u in [0, 1) picks the first slot with u < cdf.
+        """
+        if self._cdf is None:
+            cdf = np.cumsum(self.probs, axis=2)
+            cdf[self.legal] /= cdf[self.legal][:, -1:]
+            self._cdf = cdf
+        return self._cdf
+
+    def stateId(self, state):
+        """
+        Returns the integer id of 'state'.
+        """
+        row, col = state
+        if row < 0:
+            return 0
+        return int(self.cellIndex[row, col])
+
+    def transitionMatrix(self):
+        """
+        Returns the transitions as a scipy CSR matrix of shape
+        (numStates * numActions, numStates), built on first use.
+        Row s * numActions + a holds the successors of (s, a).
+        """
+        if self._csr is None:
+            from scipy.sparse import csr_matrix
+
+            numStates, numActions, slots = self.probs.shape
+            rows = np.repeat(np.arange(numStates * numActions), slots)
+            P = csr_matrix((self.probs.ravel(), (rows, self.nextStates.ravel())),
+                           shape=(numStates * numActions, numStates))
+            P.eliminate_zeros()
+            self._csr = P
+        return self._csr
+
+    def denseTransitions(self):
+        """
+        Returns the transitions as a dense array P[s, a, s'], built on
+        first use. Needs numStates^2 * numActions floats, so this is
+        only meant for small grids.
+        """
+        if self._dense is None:
+            numStates, numActions, slots = self.probs.shape
+            P = np.zeros((numStates, numActions, numStates))
+            s, a, k = np.indices(self.probs.shape)
+            np.add.at(P, (s, a, self.nextStates), self.probs)
+            self._dense = P
+        return self._dense
+
+    def predecessors(self, states):
+        """
+        Returns the sorted ids of all states that have an action
+        reaching one of 'states' with non-zero probability. The
+        incoming edges are indexed on first use.
+        """
+        if self._incoming is None:
+            numStates, numActions, slots = self.probs.shape
+            reachable = self.probs.ravel() > 0
+            sources = np.repeat(np.arange(numStates, dtype=np.int32), numActions * slots)[reachable]
+            targets = self.nextStates.ravel()[reachable]
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(targets, minlength=numStates))))
+            self._incoming = (offsets, sources[np.argsort(targets, kind='stable')])
+        offsets, sources = self._incoming
+
+        states = np.asarray(states, dtype=np.int64)
+        starts = offsets[states]
+        counts = offsets[states + 1] - starts
+        firsts = np.cumsum(counts) - counts
+        edges = np.arange(counts.sum()) - np.repeat(firsts - starts, counts)
+        return np.unique(sources[edges])
+
+    def diff(self, old):
+        """
+        Compares this compile with an 'old' compile of the same grid
+        after a change of noise, living reward or cells. Returns, per
+        state id of this compile, the id of the same cell in 'old'
+        (-1 where 'old' had a wall) and whether the actions,
+        successors, probabilities or rewards of the state differ.
+        """
+        if (old.rows, old.cols) != (self.rows, self.cols):
+            raise ValueError('Cannot diff grids of different sizes')
+
+        oldIds = np.zeros(self.numStates, dtype=np.int32)
+        oldIds[1:] = old.cellIndex[self.stateRows[1:], self.stateCols[1:]]
+        kept = np.nonzero(oldIds >= 0)[0]
+        newIds = np.full(old.numStates, -1, dtype=np.int32)
+        newIds[oldIds[kept]] = kept
+
+        o = oldIds[kept]
+        same = (self.legal[kept] == old.legal[o]).all(axis=1)
+        same &= (self.rewards[kept] == old.rewards[o]).all(axis=1)
+        same &= (self.probs[kept] == old.probs[o]).all(axis=(1, 2))
+        same &= (self.nextStates[kept] == newIds[old.nextStates[o]]).all(axis=(1, 2))
+        changed = np.ones(self.numStates, dtype=bool)
+        changed[kept[same]] = False
+        return oldIds, changed
+
+    def memoryReport(self):
+        """
+        Returns the bytes of transitions and rewards resident while
+        planning with each backend in TRANSITIONS. The padded table
+        (nextStates, probs, slips) is always kept, since the other
+        stores are built from it, so 'csr' and 'dense' report it plus
+        their own arrays. Stores that have not been built are
+        estimated without allocating them.
+        """
+        numStates, numActions, slots = self.probs.shape
+        padded = (self.nextStates.nbytes + self.probs.nbytes + self.slips.nbytes
+                  + self.rewards.nbytes + self.legal.nbytes)
+        nonzeros = int(np.count_nonzero(self.probs))
+        if self._csr is not None:
+            csr = self._csr.data.nbytes + self._csr.indices.nbytes + self._csr.indptr.nbytes
+        else:
+            csr = nonzeros * (8 + 4) + (numStates * numActions + 1) * 4
+        return {'padded': padded,
+                'csr': padded + csr,
+                'dense': padded + numStates * numActions * numStates * 8}
+
+    def expectedValues(self, V, out=None, transitions='padded', states=None):
+        """
+        Returns E[V(s')] for every (state, action) pair as an array of
+        shape (numStates, numActions), writing into 'out' if given.
+        'transitions' picks the backend, one of TRANSITIONS. Given an
+        array of state ids 'states', only their rows are computed.
+        """
+        numActions = len(self.actions)
+        shape = self.rewards.shape if states is None else (len(states), numActions)
+        if transitions == 'csr':
+            P = self.transitionMatrix()
+            if states is not None:
+                P = P[(states[:, None] * numActions + np.arange(numActions)).ravel()]
+            result = (P @ V).reshape(shape)
+        elif transitions == 'dense':
+            P = self.denseTransitions()
+            result = (P if states is None else P[states]) @ V
+        else:
+            result = None
+        if result is not None:
+            if out is None:
+                return result
+            out[...] = result
+            return out
+
+        probs, nextStates = self.probs, self.nextStates
+        if states is not None:
+            probs, nextStates = probs[states], nextStates[states]
+        if out is None:
+            out = np.empty(shape)
+        np.multiply(probs[:, :, 0], V[nextStates[:, :, 0]], out=out)
+        for k in range(1, self.SLOTS):
+            out += probs[:, :, k] * V[nextStates[:, :, k]]
+        return out
+
+    def qValues(self, V, discount, out=None, transitions='padded', states=None):
+        """
+        Returns the q-values R(s, a) + discount * E[V(s')] under 'V',
+        for all states or only the ids in 'states'. Illegal actions
+        get -inf.
+        """
+        out = self.expectedValues(V, out, transitions, states)
+        out *= discount
+        if states is None:
+            out += self.rewards
+            out[~self.legal] = -np.inf
+        else:
+            out += self.rewards[states]
+            out[~self.legal[states]] = -np.inf
+        return out
+
+    def greedyPolicy(self, Q):
+        """
+        Returns the id of the best action per state, or -1 for states
+        without actions. Ties go to the last action in ACTIONS order.
+        Q may carry leading batch axes, e.g. (variants, states, actions).
+        """
+        numActions = Q.shape[-1]
+        policy = numActions - 1 - np.argmax(Q[..., ::-1], axis=-1)
+        policy[..., ~self.legal.any(axis=1)] = -1
+        return policy
+
+    def valueIteration(self, discount, iterations, tolerance=0.0, initialValues=None, transitions='padded',
+                       variants=None, stats=None):
+        """
+        Value iteration on the compiled arrays, one batched Bellman
+        backup per sweep, starting from 'initialValues' (by state id)
+        or from V = 0. Stops after 'iterations' sweeps or once the
+        sup-norm residual max|V' - V| is at most 'tolerance'. The
+        policy is greedy w.r.t. the values the last sweep backed up
+        from. Returns the values, the policy ids, the number of sweeps
+        and the last residual.
+
+        With variants=(probs, rewards), arrays (K, S, A, slots) and
+        (K, S, A) of K settings of this layout (see
+        batchedPlanning.stackVariants), and an array of K discounts,
+        all settings run at once, each with its own stopping rule, and
+        every result gets a leading axis of K. Settings that have
+        converged are dropped from the batch.
+
+        'stats' is an optional PlanningStats that gets one record per
+        sweep.
+        """
+        hasActions = self.legal.any(axis=1)
+        if variants is None:
+            discounts = np.array([discount], dtype=float)
+            Q = np.where(self.legal, 0.0, -np.inf)
+            finalQ = Q[None]
+
+            def backup(values):
+                self.qValues(values[0], discount, Q, transitions)
+                return finalQ
+        else:
+            discounts = np.asarray(discount, dtype=float)
+            finalQ = np.where(self.legal, 0.0, -np.inf)[None].repeat(len(discounts), axis=0)
+            # one contiguous (K, S, A) block per slot, and illegal actions
+            # folded into the rewards as -inf
+            nextStates = [np.ascontiguousarray(self.nextStates[:, :, k]) for k in range(self.SLOTS)]
+            batch = {'discounts': discounts, 'probs': np.ascontiguousarray(np.moveaxis(variants[0], -1, 0)),
+                     'rewards': np.where(self.legal, variants[1], -np.inf)}
+
+            def backup(values):
+                probs = batch['probs']
+                q = probs[0] * np.take(values, nextStates[0], axis=1)
+                for k in range(1, self.SLOTS):
+                    q += probs[k] * np.take(values, nextStates[k], axis=1)
+                q *= batch['discounts'][:, None, None]
+                q += batch['rewards']
+                return q
+
+        numVariants = len(discounts)
+        if initialValues is None:
+            V = np.zeros((numVariants, self.numStates))
+        else:
+            V = np.array(np.broadcast_to(initialValues, (numVariants, self.numStates)), dtype=float)
+        sweeps = np.zeros(numVariants, dtype=int)
+        residuals = np.full(numVariants, np.inf)
+        if stats is not None and variants is None:
+            policyIds = self.greedyPolicy(Q)
+
+        # working copies of the unconverged settings, compacted only when some converge
+        active = np.arange(numVariants)
+        values = V.copy()
+        for i in range(iterations):
+            if len(active) == 0:
+                break
+            q = backup(values)
+            newV = np.where(hasActions, q.max(axis=2), 0.0)
+            residual = np.abs(newV - values).max(axis=1)
+            values = newV
+            sweeps[active] += 1
+            if stats is not None:
+                changes = None
+                if variants is None:
+                    greedy = self.greedyPolicy(Q)
+                    changes = np.count_nonzero(greedy != policyIds)
+                    policyIds = greedy
+                stats.record('sweep', residual.max(), changes, len(active) * self.numStates)
+
+            done = residual <= tolerance
+            if done.any() or i == iterations - 1:
+                V[active] = values
+                residuals[active] = residual
+                if variants is not None:
+                    finalQ[active] = q
+                keep = ~done
+                active, values = active[keep], values[keep]
+                if variants is not None:
+                    batch.update(discounts=batch['discounts'][keep], probs=batch['probs'][:, keep],
+                                 rewards=batch['rewards'][keep])
+
+        policyIds = self.greedyPolicy(finalQ)
+        if variants is None:
+            return V[0], policyIds[0], int(sweeps[0]), residuals[0]
+        return V, policyIds, sweeps, residuals
@@ -0,0 +1,164 @@
+import numpy as np
+
+from gridworldClass import Gridworld
+
+
+# PROCEDURAL GRIDS OF ARBITRARY SIZE
+#
+# Every generator takes a seed and returns a Gridworld that uses the same
+# cell conventions as the hand-written grids in gridworld.py: ' ' is free,
+# '#' is a wall, 'S' is the start and numbers are exit states.
+
+
+def generateMaze(rows, cols, seed=None, wallDensity=1.0, goalReward=10, numGoals=1, goalLayout='corner'):
+    """
+    A maze carved by a randomized depth-first search. Cells at even
+    coordinates are rooms, the cells between them are walls until
+    the search knocks them down.
+
+    wallDensity is the fraction of the remaining inner walls that is
+    kept: 1.0 gives a perfect maze with a single path between any
+    two cells, lower values open loops.
+    """
+    rng = np.random.default_rng(seed)
+    cells = np.full((rows, cols), '#', dtype=object)
+    mazeRows, mazeCols = (rows + 1) // 2, (cols + 1) // 2
+
+    visited = np.zeros((mazeRows, mazeCols), dtype=bool)
+    moves = ((-1, 0), (0, -1), (1, 0), (0, 1))
+    stack = [(0, 0)]
+    visited[0, 0] = True
+    cells[0, 0] = ' '
+    while stack:
+        r, c = stack[-1]
+        options = [(r + dr, c + dc) for dr, dc in moves
+                   if 0 <= r + dr < mazeRows and 0 <= c + dc < mazeCols and not visited[r + dr, c + dc]]
+        if not options:
+            stack.pop()
+            continue
+        nr, nc = options[rng.integers(len(options))]
+        visited[nr, nc] = True
+        cells[2 * nr, 2 * nc] = ' '
+        cells[r + nr, c + nc] = ' '
+        stack.append((nr, nc))
+
+    # open loops by removing a share of the walls between two rooms
+    if wallDensity < 1.0:
+        inner = np.zeros((rows, cols), dtype=bool)
+        inner[0::2, 1::2] = True
+        inner[1::2, 0::2] = True
+        inner[-1, :] &= rows % 2 == 1
+        inner[:, -1] &= cols % 2 == 1
+        remove = inner & (cells == '#') & (rng.random((rows, cols)) >= wallDensity)
+        cells[remove] = ' '
+
+    return finishGrid(cells, rng, goalReward, numGoals, goalLayout)
+
+
+def generateRooms(rows, cols, seed=None, roomSize=10, wallDensity=0.0, goalReward=10, numGoals=1,
+                  goalLayout='corner'):
+    """
+    Open rooms of roomSize x roomSize cells separated by walls with
+    one random door per wall segment. wallDensity is the probability
+    of an extra obstacle on every free cell inside the rooms.
+    """
+    rng = np.random.default_rng(seed)
+    cells = np.full((rows, cols), ' ', dtype=object)
+    cells[rng.random((rows, cols)) < wallDensity] = '#'
+
+    step = roomSize + 1
+    for r in range(roomSize, rows, step):
+        cells[r, :] = '#'
+        for c0 in range(0, cols, step):
+            c1 = min(c0 + roomSize, cols)
+            cells[r, rng.integers(c0, c1)] = ' '
+    for c in range(roomSize, cols, step):
+        cells[:, c] = '#'
+        for r0 in range(0, rows, step):
+            r1 = min(r0 + roomSize, rows)
+            cells[rng.integers(r0, r1), c] = ' '
+
+    return finishGrid(cells, rng, goalReward, numGoals, goalLayout)
+
+
+def generateCliff(rows, cols, seed=None, wallDensity=0.0, goalReward=10, cliffReward=-100):
+    """
+    The CliffGrid scaled up: the bottom row is a cliff of exit
+    states, the start sits at the left end of the row above it and
+    the goal at the right end. wallDensity is the probability of an
+    obstacle on every other free cell.
+    """
+    rng = np.random.default_rng(seed)
+    cells = np.full((rows, cols), ' ', dtype=object)
+    cells[rng.random((rows, cols)) < wallDensity] = '#'
+    cells[-1, :] = cliffReward
+    cells[-2, 0] = 'S'
+    cells[-2, -1] = goalReward
+    return Gridworld(cells.tolist())
+
+
+def generateBridge(length, width=1, seed=None, wallDensity=0.0, goalReward=10, nearReward=1, cliffReward=-100):
+    """
+    The BridgeGrid scaled up: a bridge of 'length' x 'width' cells
+    between a small exit on the left and the goal on the right, with
+    cliffs above and below. wallDensity is the probability of an
+    obstacle on every bridge cell.
+    """
+    rng = np.random.default_rng(seed)
+    rows, cols = width + 2, length + 2
+    cells = np.full((rows, cols), ' ', dtype=object)
+    cells[1:-1, 1:-1][rng.random((width, length)) < wallDensity] = '#'
+    cells[0, :] = cliffReward
+    cells[-1, :] = cliffReward
+    cells[0, 0] = cells[0, -1] = cells[-1, 0] = cells[-1, -1] = '#'
+    middle = 1 + width // 2
+    cells[1:-1, 0] = '#'
+    cells[1:-1, -1] = '#'
+    cells[middle, 0] = nearReward
+    cells[middle, -1] = goalReward
+    cells[middle, 1] = 'S'
+    return Gridworld(cells.tolist())
+
+
+def finishGrid(cells, rng, goalReward, numGoals, goalLayout):
+    """
+    Places the start and the goals on free cells and wraps the
+    cells into a Gridworld.
+
+    With goalLayout='corner' the start is the first free cell in
+    row-major order and the goals are the last free cells. With
+    goalLayout='random' the start and the goals are drawn uniformly
+    from the free cells.
+    """
+    free = np.flatnonzero(cells.ravel() == ' ')
+    if len(free) < numGoals + 1:
+        raise ValueError('Grid has not enough free cells for the start and %i goals' % numGoals)
+
+    if goalLayout == 'corner':
+        start, goals = free[0], free[len(free) - numGoals:]
+    elif goalLayout == 'random':
+        picked = rng.choice(free, size=numGoals + 1, replace=False)
+        start, goals = picked[0], picked[1:]
+    else:
+        raise ValueError('Unknown goal layout: ' + goalLayout)
+
+    flat = cells.ravel()
+    flat[start] = 'S'
+    flat[goals] = goalReward
+    return Gridworld(cells.tolist())
+
+
+GENERATORS = {'maze': generateMaze, 'rooms': generateRooms, 'cliff': generateCliff}
+
+
+def generateGrid(kind, rows, cols, seed=None, **options):
+    """
+    Returns a generated grid of the given kind ('maze', 'rooms',
+    'cliff' or 'bridge') and size. For bridges 'cols' is the length
+    and 'rows' the width of the bridge.
+    """
+    if kind == 'bridge':
+        return generateBridge(cols, rows, seed, **options)
+    if kind not in GENERATORS:
+        raise ValueError('Unknown grid kind: ' + kind)
+    return GENERATORS[kind](rows, cols, seed, **options)
@@ -0,0 +1,176 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# MULTI-CORE BELLMAN SWEEPS OVER SHARED MEMORY
+#
+# The compiled arrays and two value buffers live in shared memory. Every
+# worker process attaches to them once and then backs up one band of grid
+# rows per task, reading values from one buffer and writing the other, so a
+# sweep is synchronized simply by waiting for all bands to finish.
+
+SHARED = {}  # arrays attached by a worker process
+
+
+def attachShared(spec):
+    """
+    Pool initializer: maps the shared memory blocks described by
+    'spec' (name -> (block name, shape, dtype)) into numpy arrays.
+    """
+    for name, (blockName, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=blockName)
+        SHARED[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        SHARED[name + 'Block'] = block
+
+
+def bandQValues(start, stop, discount, source):
+    """
+    Q-values of the states start..stop-1 under value buffer 'source'.
+    """
+    nextStates = SHARED['nextStates'][start:stop]
+    probs = SHARED['probs'][start:stop]
+    V = SHARED['values'][source]
+    Q = probs[:, :, 0] * V[nextStates[:, :, 0]]
+    for k in range(1, nextStates.shape[2]):
+        Q += probs[:, :, k] * V[nextStates[:, :, k]]
+    Q *= discount
+    Q += SHARED['rewards'][start:stop]
+    Q[~SHARED['legal'][start:stop]] = -np.inf
+    return Q
+
+
+def valueBackup(start, stop, discount, source):
+    """
+    One value iteration backup of a band. Returns its largest change.
+    """
+    Q = bandQValues(start, stop, discount, source)
+    hasActions = SHARED['legal'][start:stop].any(axis=1)
+    newV = np.where(hasActions, Q.max(axis=1), 0.0)
+    values = SHARED['values']
+    values[1 - source, start:stop] = newV
+    return float(np.abs(newV - values[source, start:stop]).max())
+
+
+def policyBackup(start, stop, discount, source):
+    """
+    One policy evaluation backup of a band under the shared policy.
+    Returns its largest change.
+    """
+    policy = SHARED['policy'][start:stop]
+    states = np.arange(stop - start)
+    actions = np.maximum(policy, 0)
+    nextStates = SHARED['nextStates'][start:stop][states, actions]
+    probs = SHARED['probs'][start:stop][states, actions]
+    values = SHARED['values']
+    newV = SHARED['rewards'][start:stop][states, actions] + discount * (probs * values[source][nextStates]).sum(axis=1)
+    newV[policy < 0] = 0.0
+    values[1 - source, start:stop] = newV
+    return float(np.abs(newV - values[source, start:stop]).max())
+
+
+def policyImprovement(start, stop, discount, source):
+    """
+    Greedy improvement of a band under value buffer 'source'. An
+    action only changes on a strict improvement, so ties cannot
+    cycle. Returns the number of changed actions.
+    """
+    Q = bandQValues(start, stop, discount, source)
+    policy = SHARED['policy'][start:stop]
+    states = np.nonzero(SHARED['legal'][start:stop].any(axis=1))[0]
+    numActions = Q.shape[1]
+    greedy = numActions - 1 - np.argmax(Q[states, ::-1], axis=1)
+    current = Q[states, policy[states]]
+    best = Q[states, greedy]
+    improved = best > current + 1e-12 * (1.0 + np.abs(current))
+    policy[states[improved]] = greedy[improved]
+    return int(improved.sum())
+
+
+class ParallelSweeper:
+    """
+    Runs Bellman sweeps of a CompiledGridworld on a process pool.
+
+    The states are partitioned into bands of whole grid rows (state
+    ids are row-major, so a band is a contiguous id range) and every
+    band is one task per sweep. Call close() when done to stop the
+    pool and free the shared memory.
+    """
+
+    def __init__(self, compiled, workers, bandsPerWorker=4):
+        self.compiled = compiled
+        self.workers = workers
+        self.blocks = []
+        self.arrays = {}
+        spec = {}
+        numStates = compiled.numStates
+        for name, array in (('nextStates', compiled.nextStates), ('probs', compiled.probs),
+                            ('rewards', compiled.rewards), ('legal', compiled.legal),
+                            ('values', np.zeros((2, numStates))),
+                            ('policy', np.full(numStates, -1, dtype=np.int64))):
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[...] = array
+            self.blocks.append(block)
+            self.arrays[name] = shared
+            spec[name] = (block.name, array.shape, array.dtype)
+
+        # band boundaries at the first state id of evenly spaced grid rows
+        rows = compiled.stateRows
+        numBands = max(1, min(workers * bandsPerWorker, compiled.rows))
+        bandRows = np.linspace(0, compiled.rows, numBands + 1).astype(int)[1:-1]
+        cuts = np.searchsorted(rows[1:], bandRows) + 1
+        bounds = np.unique(np.concatenate(([0], cuts, [numStates])))
+        self.bands = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        self.source = 0
+        self.pool = ProcessPoolExecutor(workers, initializer=attachShared, initargs=(spec,))
+
+    def getValues(self):
+        return self.arrays['values'][self.source].copy()
+
+    def setValues(self, V):
+        self.arrays['values'][self.source] = V
+
+    def getPolicy(self):
+        return self.arrays['policy'].copy()
+
+    def setPolicy(self, policyIds):
+        self.arrays['policy'][...] = policyIds
+
+    def run(self, function, discount):
+        starts, stops = zip(*self.bands)
+        count = len(self.bands)
+        return list(self.pool.map(function, starts, stops, [discount] * count, [self.source] * count))
+
+    def valueSweep(self, discount):
+        """
+        One value iteration sweep. Returns the sup-norm residual.
+        """
+        residual = max(self.run(valueBackup, discount))
+        self.source = 1 - self.source
+        return residual
+
+    def policySweep(self, discount):
+        """
+        One policy evaluation sweep under the shared policy. Returns
+        the sup-norm residual.
+        """
+        residual = max(self.run(policyBackup, discount))
+        self.source = 1 - self.source
+        return residual
+
+    def improve(self, discount):
+        """
+        Greedy improvement of the shared policy. Returns the number
+        of states whose action changed.
+        """
+        return sum(self.run(policyImprovement, discount))
+
+    def close(self):
+        self.pool.shutdown()
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
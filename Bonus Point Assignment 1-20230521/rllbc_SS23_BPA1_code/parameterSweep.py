@@ -0,0 +1,168 @@
+import csv
+import itertools
+import json
+import optparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import gridworld
+from batchedPlanning import solveBatch
+
+
+# SWEEP OF DISCOUNT, NOISE AND LIVING REWARD ON ONE GRID
+#
+# The grid is compiled once; every setting only derives new probabilities and
+# rewards from it (CompiledGridworld.withParameters) and runs value iteration
+# on the arrays (CompiledGridworld.valueIteration, the loop of
+# ValueIterationAgent), so no display and no per-setting grid build is involved.
+# With a batch size the settings are solved in stacks by solveBatch instead.
+
+SWEEP = {}  # compiled grid of a worker process
+
+
+def parseRange(text):
+    """
+    Parses 'start:stop:count' (count evenly spaced values including
+    both ends), a comma separated list or a single number.
+    """
+    if ':' in text:
+        start, stop, count = text.split(':')
+        return np.linspace(float(start), float(stop), int(count)).tolist()
+    return [float(v) for v in text.split(',')]
+
+
+def setSweepGrid(compiled):
+    """
+    Pool initializer: keeps the compiled grid in the worker.
+    """
+    SWEEP['compiled'] = compiled
+
+
+def solveSetting(setting, iterations, tolerance):
+    """
+    Solves one (discount, noise, livingReward) setting on the grid of
+    this process.
+    """
+    discount, noise, livingReward = setting
+    compiled = SWEEP['compiled'].withParameters(noise, livingReward)
+    V, policyIds, sweeps, residual = compiled.valueIteration(discount, iterations, tolerance)
+    return V, policyIds, sweeps
+
+
+def solveSettings(batch, iterations, tolerance):
+    """
+    Solves a list of settings as one stack on the grid of this
+    process. Returns one (values, policy ids, sweeps) per setting.
+    """
+    V, policyIds, sweeps = solveBatch(SWEEP['compiled'], batch, iterations, tolerance)
+    return list(zip(V, policyIds, sweeps.tolist()))
+
+
+def runSweep(mdp, discounts, noises, livingRewards, iterations=1000, tolerance=1e-8, workers=1, batchSize=0):
+    """
+    Solves every combination of the given discounts, noises and
+    living rewards on 'mdp'. Returns the settings and, per setting,
+    the values, policy ids and sweeps of value iteration.
+
+    With batchSize > 0 the settings are solved in stacks of that
+    many variants, otherwise one by one.
+    """
+    compiled = mdp.compile()
+    settings = list(itertools.product(discounts, noises, livingRewards))
+    if batchSize > 0:
+        function = solveSettings
+        tasks = [settings[i:i + batchSize] for i in range(0, len(settings), batchSize)]
+    else:
+        function = solveSetting
+        tasks = settings
+    iterationsList = [iterations] * len(tasks)
+    tolerances = [tolerance] * len(tasks)
+    if workers > 1:
+        chunk = max(1, len(tasks) // (4 * workers))
+        with ProcessPoolExecutor(workers, initializer=setSweepGrid, initargs=(compiled,)) as pool:
+            results = list(pool.map(function, tasks, iterationsList, tolerances, chunksize=chunk))
+    else:
+        setSweepGrid(compiled)
+        results = list(map(function, tasks, iterationsList, tolerances))
+    if batchSize > 0:
+        results = [result for batch in results for result in batch]
+    return compiled, settings, results
+
+
+def sweepTable(compiled, settings, results):
+    """
+    One row per setting with the start value and the value and
+    policy of every state ('' for states without actions).
+    """
+    states = compiled.states[1:]
+    rows = []
+    for (discount, noise, livingReward), (V, policyIds, sweeps) in zip(settings, results):
+        row = {'discount': discount, 'noise': noise, 'livingReward': livingReward, 'sweeps': sweeps,
+               'startValue': float(V[compiled.startState])}
+        for s, state in enumerate(states, 1):
+            name = '%i,%i' % state
+            row['V(%s)' % name] = float(V[s])
+            row['pi(%s)' % name] = compiled.actions[policyIds[s]] if policyIds[s] >= 0 else ''
+        rows.append(row)
+    return rows
+
+
+def writeTable(rows, path):
+    """
+    Writes the rows to 'path' as JSON if it ends with '.json' and as
+    CSV otherwise.
+    """
+    with open(path, 'w', newline='') as f:
+        if path.endswith('.json'):
+            json.dump(rows, f, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def parseOptions():
+    optParser = optparse.OptionParser(usage='python parameterSweep.py [options]')
+    optParser.add_option('-g', '--grid', action='store', type='string', dest='grid', default='DiscountGrid',
+                         help='Grid to use (case sensitive, as in gridworld.py, default %default)')
+    optParser.add_option('-d', '--discount', action='store', type='string', dest='discounts', default='0.9',
+                         help='Discounts as start:stop:count, a comma separated list or one value '
+                              '(default %default)')
+    optParser.add_option('-n', '--noise', action='store', type='string', dest='noises', default='0.2',
+                         help='Noises, same format as the discounts (default %default)')
+    optParser.add_option('-r', '--livingReward', action='store', type='string', dest='livingRewards',
+                         default='0.0', help='Living rewards, same format as the discounts (default %default)')
+    optParser.add_option('-i', '--iterations', action='store', type='int', dest='iters', default=1000,
+                         help='Maximum number of value iteration sweeps per setting (default %default)')
+    optParser.add_option('--tolerance', action='store', type='float', dest='tolerance', default=1e-8,
+                         help='Stop a setting once no value changes by more than this (default %default)')
+    optParser.add_option('--workers', action='store', type='int', dest='workers', default=os.cpu_count() or 1,
+                         help='Worker processes (default %default)')
+    optParser.add_option('--batch', action='store', type='int', dest='batchSize', default=0,
+                         help='Solve the settings in stacks of this many variants, 0 solves them one by one '
+                              '(default %default)')
+    optParser.add_option('-o', '--output', action='store', type='string', dest='output', default='sweep.csv',
+                         help='Result file, .csv or .json (default %default)')
+    opts, args = optParser.parse_args()
+    return opts
+
+
+if __name__ == '__main__':
+
+    opts = parseOptions()
+
+    mdp = getattr(gridworld, 'get' + opts.grid)()
+    start = time.perf_counter()
+    compiled, settings, results = runSweep(mdp, parseRange(opts.discounts), parseRange(opts.noises),
+                                           parseRange(opts.livingRewards), opts.iters, opts.tolerance,
+                                           opts.workers, opts.batchSize)
+    seconds = time.perf_counter() - start
+
+    rows = sweepTable(compiled, settings, results)
+    writeTable(rows, opts.output)
+    policies = set(policyIds.tobytes() for V, policyIds, sweeps in results)
+    print('Solved %i settings in %.2fs, %i distinct policies' % (len(settings), seconds, len(policies)))
+    print('Results written to ' + opts.output)
@@ -0,0 +1,80 @@
+import csv
+import json
+import time
+
+
+# CONVERGENCE AND TIMING RECORDS OF THE PLANNING AGENTS
+#
+# ValueIterationAgent and PolicyIterationAgent take an optional collector and
+# call record once per sweep, improvement step or replanning round. Every
+# record holds the run it belongs to, the phase, the Bellman or evaluation
+# residual, the number of policy changes, the number of states backed up and
+# the wall time since the previous record. Values that a loop does not
+# compute are None.
+
+
+class PlanningStats:
+    """
+    Collects one record per planning iteration and exports them as
+    JSON or CSV.
+    """
+
+    FIELDS = ('run', 'iteration', 'phase', 'residual', 'policyChanges', 'statesTouched', 'seconds', 'elapsed')
+
+    def __init__(self):
+        self.records = []
+        self.run = None
+        self.iteration = 0
+        self.started = self.last = time.perf_counter()
+
+    def begin(self, run):
+        """
+        Starts the records of a new run, e.g. 'runVectorized', and
+        restarts its clock.
+        """
+        self.run = run
+        self.iteration = 0
+        self.started = self.last = time.perf_counter()
+
+    def record(self, phase, residual=None, policyChanges=None, statesTouched=None):
+        """
+        Adds the record of one iteration of the current run. The wall
+        time is measured from the previous record of the run.
+        """
+        now = time.perf_counter()
+        self.records.append({'run': self.run, 'iteration': self.iteration, 'phase': phase,
+                             'residual': None if residual is None else float(residual),
+                             'policyChanges': None if policyChanges is None else int(policyChanges),
+                             'statesTouched': None if statesTouched is None else int(statesTouched),
+                             'seconds': now - self.last, 'elapsed': now - self.started})
+        self.iteration += 1
+        self.last = now
+
+    def summary(self):
+        """
+        Per run: the number of records, the states backed up, the
+        last residual and the wall time.
+        """
+        runs = {}
+        for record in self.records:
+            run = runs.setdefault(record['run'], {'iterations': 0, 'statesTouched': 0, 'residual': None,
+                                                  'seconds': 0.0})
+            run['iterations'] += 1
+            run['statesTouched'] += record['statesTouched'] or 0
+            if record['residual'] is not None:
+                run['residual'] = record['residual']
+            run['seconds'] = record['elapsed']
+        return runs
+
+    def write(self, path):
+        """
+        Writes the records to 'path' as JSON if it ends with '.json'
+        and as CSV otherwise.
+        """
+        with open(path, 'w', newline='') as f:
+            if path.endswith('.json'):
+                json.dump({'records': self.records, 'summary': self.summary()}, f, indent=2)
+            else:
+                writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+                writer.writeheader()
+                writer.writerows(self.records)
@@ -0,0 +1,99 @@
+import statistics
+import time
+
+import numpy as np
+
+
+# MONTE CARLO EVALUATION OF A FIXED POLICY
+#
+# Rollouts run in batches on the compiled arrays: every step samples the
+# successors of all unfinished episodes with one random draw each, and
+# finished episodes are dropped from the batch.
+
+
+def compilePolicy(compiled, agent):
+    """
+    Returns the action id of agent.getPolicy(state) for every state
+    id of 'compiled', -1 where the policy has no action. Raises a
+    ValueError if the policy returns something other than an action.
+    """
+    policyIds = np.full(compiled.numStates, -1, dtype=np.int64)
+    for s, state in enumerate(compiled.states):
+        if compiled.legal[s].any():
+            action = agent.getPolicy(state)
+            if action is not None:
+                if action not in compiled.actionIndex:
+                    raise ValueError('Policy returns %r in state %s, not an action' % (action, state))
+                policyIds[s] = compiled.actionIndex[action]
+    return policyIds
+
+
+def rollouts(compiled, policyIds, episodes, discount, maxSteps):
+    """
+    Runs 'episodes' episodes of the policy from the start state.
+    Returns their discounted returns, their lengths and the number
+    of episodes still running after 'maxSteps' steps.
+    """
+    returns = np.zeros(episodes)
+    lengths = np.zeros(episodes, dtype=np.int64)
+    active = np.arange(episodes)
+    states = np.full(episodes, compiled.startState, dtype=np.int64)
+    cdf = compiled.cdf
+    totalDiscount = 1.0
+    for t in range(maxSteps):
+        actions = policyIds[states]
+        running = actions >= 0
+        if not running.all():
+            active, states, actions = active[running], states[running], actions[running]
+        if len(active) == 0:
+            break
+
+        rand = np.random.random(len(active))
+        slots = (rand[:, None] >= cdf[states, actions]).sum(axis=1)
+        np.minimum(slots, compiled.SLOTS - 1, out=slots)
+        returns[active] += totalDiscount * compiled.rewards[states, actions]
+        lengths[active] += 1
+        states = compiled.nextStates[states, actions, slots]
+        totalDiscount *= discount
+    truncated = np.count_nonzero(policyIds[states] >= 0)
+    return returns, lengths, truncated
+
+
+def evaluatePolicy(mdp, policy, episodes=100000, discount=0.9, maxSteps=1000, confidence=0.95,
+                   batchSize=100000):
+    """
+    Estimates the discounted return of 'policy' from the start state
+    of the Gridworld 'mdp' by 'episodes' rollouts, run 'batchSize' at
+    a time. 'policy' is an agent with getPolicy or an array of action
+    ids per compiled state id. Episodes are cut off after 'maxSteps'
+    steps.
+
+    Returns a dict with all 'returns' and 'lengths', the 'mean' and
+    'std' of the returns, the normal confidence interval 'ci' of the
+    mean at level 'confidence', 'meanLength', 'maxLength', the number
+    of 'truncated' episodes and the 'seconds' taken.
+    """
+    start = time.perf_counter()
+    compiled = mdp.compile()
+    if compiled.startState is None:
+        raise ValueError('Grid has no start state')
+    policyIds = policy if isinstance(policy, np.ndarray) else compilePolicy(compiled, policy)
+    if (policyIds >= 0).any() and not compiled.legal[policyIds >= 0, policyIds[policyIds >= 0]].all():
+        raise ValueError('Policy takes an illegal action')
+
+    returns, lengths, truncated = [], [], 0
+    for first in range(0, episodes, batchSize):
+        batchReturns, batchLengths, batchTruncated = rollouts(compiled, policyIds, min(batchSize, episodes - first),
+                                                              discount, maxSteps)
+        returns.append(batchReturns)
+        lengths.append(batchLengths)
+        truncated += batchTruncated
+    returns, lengths = np.concatenate(returns), np.concatenate(lengths)
+
+    mean = float(returns.mean())
+    std = float(returns.std(ddof=1)) if episodes > 1 else 0.0
+    halfWidth = statistics.NormalDist().inv_cdf((1 + confidence) / 2.0) * std / np.sqrt(episodes)
+    return {'returns': returns, 'lengths': lengths, 'mean': mean, 'std': std,
+            'ci': (float(mean - halfWidth), float(mean + halfWidth)), 'meanLength': float(lengths.mean()),
+            'maxLength': int(lengths.max()), 'truncated': truncated,
+            'seconds': time.perf_counter() - start}
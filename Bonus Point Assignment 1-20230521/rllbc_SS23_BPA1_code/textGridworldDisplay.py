@@ -1,4 +1,7 @@
 from functools import reduce
+from itertools import zip_longest
+
+import util
 
 
 class TextGridworldDisplay:
@@ -206,12 +209,12 @@ def indent(rows, hasHeader=False, headerChar='-', delim=' | ', justify='left',
     # closure for breaking logical rows to physical, using wrapfunc
     def rowWrapper(row):
         newRows = [wrapfunc(item).split('\n') for item in row]
-        return [[substr or '' for substr in item] for item in list(*newRows)]
+        return [[substr or '' for substr in item] for item in zip_longest(*newRows)]
 
     # break each logical row into one or more physical ones
     logicalRows = [rowWrapper(row) for row in rows]
     # columns of physical rows
-    columns = list(*reduce(operator.add, logicalRows))
+    columns = list(zip_longest(*reduce(operator.add, logicalRows)))
     # get the maximum of each column by the string length of its items
     maxWidths = [max([len(str(item)) for item in column]) for column in columns]
     rowSeparator = headerChar * (len(prefix) + len(postfix) + sum(maxWidths) + len(delim) * (len(maxWidths) - 1))
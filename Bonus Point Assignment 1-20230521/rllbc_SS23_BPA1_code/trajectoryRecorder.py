@@ -0,0 +1,129 @@
+import struct
+
+import numpy as np
+
+
+# BINARY RECORDS OF GRIDWORLD TRANSITIONS
+#
+# One record per step, with states and actions as compiled ids. Records are
+# kept in a preallocated buffer; with a path the buffer is appended to a .npy
+# file whenever it is full, and the header of the file is rewritten with the
+# new record count on every flush. The file is therefore always a valid .npy
+# that np.load(path, mmap_mode='r') can open, even while recording.
+
+DTYPE = np.dtype([('episode', np.int32), ('t', np.int32), ('state', np.int32), ('action', np.int8),
+                  ('reward', np.float64), ('nextState', np.int32)])
+
+HEADER_SIZE = 256  # bytes of magic, length and header dict, a multiple of 64
+
+
+def npyHeader(count):
+    """
+    The .npy (version 1.0) header of 'count' records, padded to a
+    fixed size so that it can be rewritten in place.
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(DTYPE), count)
+    size = HEADER_SIZE - len(np.lib.format.magic(1, 0)) - 2
+    if len(header) >= size:
+        raise ValueError('Record count too large for the .npy header')
+    return np.lib.format.magic(1, 0) + struct.pack('<H', size) + (header.ljust(size - 1) + '\n').encode('latin1')
+
+
+def loadTrajectories(path):
+    """
+    Opens a recorded .npy file as a read-only memory map of records.
+    """
+    return np.load(path, mmap_mode='r')
+
+
+class TrajectoryRecorder:
+    """
+    Collects (episode, t, state, action, reward, nextState) records.
+
+    Without a path the buffer grows as needed and getRecords returns
+    the records in memory. With a path every 'chunkSize' records are
+    appended to that .npy file and getRecords memory-maps it.
+    """
+
+    def __init__(self, path=None, chunkSize=65536):
+        self.path = path
+        self.buffer = np.empty(chunkSize, dtype=DTYPE)
+        self.size = 0  # records in the buffer
+        self.flushed = 0  # records in the file
+        self.file = None
+        if path is not None:
+            self.file = open(path, 'wb+')
+            self.file.write(npyHeader(0))
+
+    def __len__(self):
+        return self.flushed + self.size
+
+    def reserve(self, n):
+        """
+        Makes room for n more records in the buffer, by flushing it
+        to the file or, in memory, by growing it.
+        """
+        if self.size + n <= len(self.buffer):
+            return
+        if self.file is not None:
+            self.flush()
+        if self.size + n > len(self.buffer):
+            grown = np.empty(max(2 * len(self.buffer), self.size + n), dtype=DTYPE)
+            grown[:self.size] = self.buffer[:self.size]
+            self.buffer = grown
+
+    def record(self, episode, t, state, action, reward, nextState):
+        """
+        Adds one transition given as compiled ids.
+        """
+        self.reserve(1)
+        self.buffer[self.size] = (episode, t, state, action, reward, nextState)
+        self.size += 1
+
+    def recordBatch(self, episode, t, state, action, reward, nextState):
+        """
+        Adds one transition per entry of the given arrays, e.g. one
+        step of a VectorizedGridworldEnvironment.
+        """
+        n = len(state)
+        self.reserve(n)
+        records = self.buffer[self.size:self.size + n]
+        records['episode'] = episode
+        records['t'] = t
+        records['state'] = state
+        records['action'] = action
+        records['reward'] = reward
+        records['nextState'] = nextState
+        self.size += n
+
+    def flush(self):
+        """
+        Appends the buffered records to the file and updates its
+        header. Does nothing without a path.
+        """
+        if self.file is None or self.size == 0:
+            return
+        self.file.seek(0, 2)
+        self.buffer[:self.size].tofile(self.file)
+        self.flushed += self.size
+        self.size = 0
+        self.file.seek(0)
+        self.file.write(npyHeader(self.flushed))
+        self.file.flush()
+
+    def getRecords(self):
+        """
+        All records so far, as an array in memory or as a memory map
+        of the file.
+        """
+        if self.file is None:
+            return self.buffer[:self.size]
+        self.flush()
+        return loadTrajectories(self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
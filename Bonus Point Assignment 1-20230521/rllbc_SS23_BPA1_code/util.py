@@ -71,19 +71,27 @@ class PriorityQueue:
     has a priority associated with it and the client is usually interested
     in quick retrieval of the lowest-priority item in the queue. This
     data structure allows O(1) access to the lowest-priority item.
+
+    Changing the priority of a queued item costs O(log n): the old
+    heap entry is marked as removed and skipped by pop, and the heap
+    is compacted once removed entries outnumber live ones.
   """
 
+    REMOVED = object()  # placeholder for entries whose priority changed
+
     def __init__(self):
         """
-      heap: A binomial heap storing [priority,item]
-      lists. 
+      heap: A binomial heap storing [priority,count,item]
+      lists. The count breaks ties in insertion order.
       
-      dict: Dictionary storing item -> [priorirty,item]
+      dict: Dictionary storing item -> [priorirty,count,item]
       maps so we can reach into heap for a given 
-      item and update the priorirty and heapify
+      item and retire its old entry
     """
         self.heap = []
         self.dict = {}
+        self.count = 0
+        self.removed = 0
 
     def push(self, item, priority):
         """
@@ -94,13 +102,55 @@ class PriorityQueue:
     is higher or lower than the current 
     priority.
     """
-        if item in self.dict:
-            self.dict[item][0] = priority
-            heapq.heapify(self.heap)
+        entry = self.dict.get(item)
+        if entry is not None:
+            if entry[0] == priority:
+                return
+            self.__retire(entry)
+        self.__insert(item, priority)
+
+    def update(self, item, priority):
+        """
+        Lowers the priority of 'item' to priority, or
+    inserts it if it is not in the queue. If 'item'
+    already has an equal or lower priority nothing
+    changes.
+    """
+        entry = self.dict.get(item)
+        if entry is not None:
+            if entry[0] <= priority:
+                return
+            self.__retire(entry)
+        self.__insert(item, priority)
+
+    def pushMany(self, items, priorities):
+        """
+        Pushes every item of 'items' with the matching
+    priority of 'priorities'. Large batches are added
+    to the heap in one O(n) heapify instead of one
+    heappush per item.
+    """
+        entries = []
+        for item, priority in zip(items, priorities):
+            entry = self.dict.get(item)
+            if entry is not None:
+                if entry[0] == priority:
+                    continue
+                entry[-1] = PriorityQueue.REMOVED
+                self.removed += 1
+            entry = [priority, self.count, item]
+            self.count += 1
+            self.dict[item] = entry
+            entries.append(entry)
+
+        if len(entries) > len(self.heap):
+            self.heap.extend(entries)
+            self.__compact()
         else:
-            pair = [priority, item]
-            heapq.heappush(self.heap, pair)
-            self.dict[item] = pair
+            for entry in entries:
+                heapq.heappush(self.heap, entry)
+            if self.removed > len(self.dict):
+                self.__compact()
 
     def getPriority(self, item):
         """
@@ -116,16 +166,47 @@ class PriorityQueue:
       Returns lowest-priority item in priority queue, or
       None if the queue is empty
     """
-        if self.isEmpty(): return None
-        (priority, item) = heapq.heappop(self.heap)
-        del self.dict[item]
-        return item
+        while self.heap:
+            (priority, count, item) = heapq.heappop(self.heap)
+            if item is not PriorityQueue.REMOVED:
+                del self.dict[item]
+                return item
+            self.removed -= 1
+        return None
+
+    def popMany(self, n):
+        """
+      Returns a list of the (up to) n lowest-priority
+      items in priority order and removes them from
+      the queue.
+    """
+        items = []
+        while len(items) < n and not self.isEmpty():
+            items.append(self.pop())
+        return items
 
     def isEmpty(self):
         """
         Returns True if the queue is empty
     """
-        return len(self.heap) == 0
+        return len(self.dict) == 0
+
+    def __insert(self, item, priority):
+        entry = [priority, self.count, item]
+        self.count += 1
+        heapq.heappush(self.heap, entry)
+        self.dict[item] = entry
+
+    def __retire(self, entry):
+        entry[-1] = PriorityQueue.REMOVED
+        self.removed += 1
+        if self.removed > len(self.dict):
+            self.__compact()
+
+    def __compact(self):
+        self.heap = [entry for entry in self.heap if entry[-1] is not PriorityQueue.REMOVED]
+        heapq.heapify(self.heap)
+        self.removed = 0
 
 
 class Counter(dict):